@@ -3,11 +3,23 @@
     Gmail:jack2919048985@gmail.com
 """
 
+from . import cache
+from . import convert
 from . import disposal
+from . import downscale
+from . import journal
+from . import manifest
+from . import move
 from . import utils
 
 __all__ = [
+    "cache",
+    "convert",
     "disposal",
+    "downscale",
+    "journal",
+    "manifest",
+    "move",
     "utils"
 ]
 
@@ -0,0 +1,114 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import json
+import os
+import os.path as path
+import pathlib
+import sqlite3
+from typing import Callable, Union
+
+from . import utils
+from .convert import file_digest
+
+# 分类规则发生变化时需递增，旧的缓存记录将自动失效
+CLASSIFY_VERSION = 1
+
+
+class ClassifyCache(object):
+    """
+    附件1/附件2、单体/整体分类结果的持久化缓存（SQLite）
+    以文件内容摘要、文件大小和修改时间为键，内容未变化的文件无需再次解析
+    """
+
+    def __init__(self, db_file: str, read_only: bool = False):
+        """
+        :param db_file: 缓存数据库文件名（绝对路径），一般位于日志目录下
+        :param read_only: 为True时只查询已有的缓存，不建立数据库也不写入分类结果（如只读检查）
+        """
+        self.__db_file = db_file
+        self.__read_only = read_only
+        self.__conn = None
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None and self.read_only:
+            # 数据库不存在时 sqlite3 以只读方式打开会失败，由调用方直接分类
+            self.__conn = sqlite3.connect(
+                pathlib.Path(path.abspath(self.db_file)).as_uri() + "?mode=ro", uri=True, timeout=30, check_same_thread=False
+            )
+        if self.__conn is None:
+            db_dir = path.dirname(self.db_file)
+            if db_dir and not path.exists(db_dir):
+                os.makedirs(db_dir)
+            # 多个进程可能同时读写同一个缓存库；扫描流水线中由分类线程使用，由扫描线程关闭
+            self.__conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None, check_same_thread=False)
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS classify ("
+                "kind TEXT, digest TEXT, size INTEGER, mtime INTEGER, version INTEGER, result TEXT, "
+                "PRIMARY KEY (kind, digest, size, mtime))"
+            )
+        return self.__conn
+
+    def classify(self, file: str, kind: str, func: Callable[[str], Union[int, bool, None]]) -> Union[int, bool, None]:
+        """
+        查询缓存中的分类结果，未命中时调用 func 进行分类并写入缓存
+        :param file: 文件名（绝对路径）
+        :param kind: 分类类别，"docx" 或 "xlsx"
+        :param func: 实际进行分类的函数
+        :return: func 的分类结果
+        """
+        try:
+            stat = os.stat(file)
+            key = (kind, file_digest(file), stat.st_size, stat.st_mtime_ns)
+            conn = self.__connect()
+            row = conn.execute(
+                "SELECT result FROM classify WHERE kind=? AND digest=? AND size=? AND mtime=? AND version=?",
+                key + (CLASSIFY_VERSION,)
+            ).fetchone()
+        except (OSError, sqlite3.Error):
+            return func(file)
+        if row is not None:
+            return json.loads(row[0])
+        result = func(file)
+        if self.read_only:
+            return result
+        try:
+            conn.execute("INSERT OR REPLACE INTO classify VALUES (?, ?, ?, ?, ?, ?)", key + (CLASSIFY_VERSION, json.dumps(result)))
+        except sqlite3.Error:
+            pass
+        return result
+
+    def docx01_or_docx02(self, file: str) -> int:
+        """
+        带缓存的 utils.docx01_or_docx02
+        :param file: 文件名（绝对路径）
+        :return: 1 -> 附件1 ; 2 -> 附件二 ; 3 -> 异常
+        """
+        if not file.endswith('.docx'):
+            # .doc/.wps 需要先转换，转换结果与运行环境有关，不进行缓存
+            return utils.docx01_or_docx02(file)
+        return self.classify(file, "docx", utils.docx01_or_docx02)
+
+    def xlsx01_or_xlsx02(self, file: str) -> bool:
+        """
+        带缓存的 utils.xlsx01_or_xlsx02
+        :param file: 文件名（绝对路径）
+        :return: True -> 单体抗震调查表 ; False -> 整体抗震统计表
+        """
+        if not file.endswith('.xlsx'):
+            return utils.xlsx01_or_xlsx02(file)
+        return self.classify(file, "xlsx", utils.xlsx01_or_xlsx02)
+
+    def close(self) -> None:
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+    @property
+    def db_file(self):
+        return self.__db_file
+
+    @property
+    def read_only(self):
+        return self.__read_only
@@ -0,0 +1,605 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import atexit
+import hashlib
+import os
+import os.path as path
+import queue
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Callable, Dict, List, Set, Tuple, Union
+
+from . import journal
+
+try:
+    import pythoncom
+    import win32com.client as win32
+except ImportError:
+    pythoncom = None
+    win32 = None
+
+# 旧格式后缀 -> 转换后的后缀
+CONVERT_SUFFIXES = {
+    '.doc': '.docx',
+    '.wps': '.docx',
+    '.xls': '.xlsx',
+}
+
+
+def file_digest(file: str, cached: bool = True) -> str:
+    """
+    计算文件内容的 sha1 摘要；大小与修改时间未变的文件直接使用之前的结果，
+    扫描时分类缓存、转换存储与处理结果清单对同一文件只需读取一次
+    :param file: 文件名（绝对路径）
+    :param cached: 为False时总是重新读取文件内容
+    :return: 十六进制摘要字符串
+    """
+    stat = os.stat(file)
+    if not cached:
+        return _file_digest.__wrapped__(file, stat.st_size, stat.st_mtime_ns)
+    return _file_digest(file, stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=4096)
+def _file_digest(file: str, size: int, mtime_ns: int) -> str:
+    sha1 = hashlib.sha1()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def converted_name(file: str) -> str:
+    """
+    旧格式文件转换后的文件名
+    :param file: 文件名（绝对路径）
+    :return: 转换后的文件名（绝对路径）
+    """
+    for suffix, new_suffix in CONVERT_SUFFIXES.items():
+        if file.endswith(suffix):
+            return path.splitext(file)[0] + new_suffix
+    return file
+
+
+def reserve_name(file: str, reserved: Set[str]) -> str:
+    """
+    目标文件已存在或已被占用时，在文件名前加上序号（与 utils.unique_name 规则相同），并占用得到的文件名
+    :param file: 目标文件名（绝对路径）
+    :param reserved: 已被占用的文件名
+    :return: 不存在且未被占用的文件名（绝对路径）
+    """
+    dir_name, file_name = path.split(file)
+    n = 1
+    while path.exists(file) or file in reserved:
+        n += 1
+        file = path.join(dir_name, f"{n:02d}-{file_name}")
+    reserved.add(file)
+    return file
+
+
+class ConverterBackend(ABC):
+    """
+    文档转换后端，一个后端对象即一个可重复使用的转换会话
+    """
+
+    @abstractmethod
+    def convert(self, file: str, file_new: str) -> None:
+        """
+        将 file 转换为 file_new，格式由 file_new 的后缀决定
+        :param file: 源文件名（绝对路径）
+        :param file_new: 目的文件名（绝对路径）
+        """
+
+    def convert_batch(self, pairs: List[Tuple[str, str]]) -> Dict[str, Union[Exception, None]]:
+        """
+        在同一个会话中转换多个文件
+        :param pairs: 由 (源文件名, 目的文件名) 组成的列表
+        :return: 源文件名 -> 转换失败时的异常，成功时为None
+        """
+        errors = {}
+        for file, file_new in pairs:
+            try:
+                self.convert(file, file_new)
+                errors[file] = None
+            except Exception as e:
+                errors[file] = e
+        return errors
+
+    def close(self) -> None:
+        pass
+
+
+class Win32Backend(ConverterBackend):
+    """
+    通过 COM 调用本机 Word/Excel 进行转换（仅限 Windows），Word/Excel 实例在会话内复用
+    COM 对象不能跨线程使用，所有调用都在会话持有的一个 COM 线程中执行，关闭会话时由该线程退出 Word/Excel
+    """
+
+    def __init__(self):
+        if win32 is None:
+            raise RuntimeError("win32com is not available")
+        self.__tasks = queue.Queue()
+        self.__apps: Dict[str, object] = {}  # 只在 COM 线程中访问
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def __run(self) -> None:
+        """
+        COM 线程：依次执行提交的调用，收到None后退出 Word/Excel
+        """
+        pythoncom.CoInitialize()
+        try:
+            for func, args, future in iter(self.__tasks.get, None):
+                try:
+                    future.set_result(func(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            for name, app in self.__apps.items():
+                try:
+                    app.Quit()
+                except Exception as e:
+                    print(f"can not quit {name}: {e}")
+            self.__apps.clear()
+            pythoncom.CoUninitialize()
+
+    def __submit(self, func: Callable, *args):
+        """
+        在 COM 线程中执行 func 并等待结果
+        """
+        if not self.__thread.is_alive():
+            raise RuntimeError("win32 session is closed")
+        future = Future()
+        self.__tasks.put((func, args, future))
+        return future.result()
+
+    def __app(self, name: str):
+        app = self.__apps.get(name)
+        if app is None:
+            if name == "word":
+                app = win32.Dispatch("Word.Application")
+            else:
+                app = win32.gencache.EnsureDispatch('Excel.Application')
+            app.DisplayAlerts = False
+            self.__apps[name] = app
+        return app
+
+    def __convert(self, file: str, file_new: str) -> None:
+        if file_new.endswith('.xlsx'):
+            wb = self.__app("excel").Workbooks.Open(file)
+            try:
+                wb.SaveAs(file_new, FileFormat=51)
+            finally:
+                wb.Close()
+        else:
+            doc = self.__app("word").Documents.Open(file)
+            try:
+                doc.SaveAs(file_new, 12)
+            finally:
+                doc.Close()
+
+    def convert(self, file: str, file_new: str) -> None:
+        self.__submit(self.__convert, file, file_new)
+
+    def close(self) -> None:
+        if self.__thread.is_alive():
+            self.__tasks.put(None)
+            self.__thread.join()
+
+
+class SofficeBackend(ConverterBackend):
+    """
+    通过 LibreOffice 无界面模式进行转换（Linux/Windows 均可），
+    每个会话使用独立且常驻的用户配置目录，可以并行运行，且只有首次启动需要初始化配置
+    """
+    FILTERS = {
+        '.docx': "docx:MS Word 2007 XML",
+        '.xlsx': "xlsx:Calc MS Excel 2007 XML",
+    }
+
+    def __init__(self, program: str = None, timeout: int = 600):
+        """
+        :param program: soffice 可执行文件，为None时在 PATH 中查找
+        :param timeout: 单次调用的超时时间（秒）
+        """
+        self.__program = program or shutil.which("soffice") or shutil.which("libreoffice")
+        if self.__program is None:
+            raise RuntimeError("soffice is not available")
+        self.__timeout = timeout
+        self.__profile = tempfile.mkdtemp(prefix="soffice-profile-")
+
+    def convert(self, file: str, file_new: str) -> None:
+        error = self.convert_batch([(file, file_new)])[file]
+        if error is not None:
+            raise error
+
+    def convert_batch(self, pairs: List[Tuple[str, str]]) -> Dict[str, Union[Exception, None]]:
+        errors = {}
+        for new_suffix, soffice_filter in self.FILTERS.items():
+            group = [(file, file_new) for file, file_new in pairs if file_new.endswith(new_suffix)]
+            while group:
+                # soffice 按源文件名生成结果，同名（如 a.doc 与 a.wps）的文件分在不同的调用中
+                stems, call, rest = set(), [], []
+                for file, file_new in group:
+                    stem = path.splitext(path.basename(file))[0]
+                    (rest if stem in stems else call).append((file, file_new))
+                    stems.add(stem)
+                self.__convert_group(call, new_suffix, soffice_filter, errors)
+                group = rest
+        for file, file_new in pairs:
+            errors.setdefault(file, ValueError(f"unsupported conversion target {file_new}"))
+        return errors
+
+    def __convert_group(self, group: List[Tuple[str, str]], new_suffix: str, soffice_filter: str,
+                        errors: Dict[str, Union[Exception, None]]) -> None:
+        """
+        一次调用转换同一格式、源文件名互不相同的多个文件
+        :param group: 由 (源文件名, 目的文件名) 组成的列表
+        :param new_suffix: 目的格式的后缀
+        :param soffice_filter: soffice 的输出过滤器
+        :param errors: 记录转换结果，源文件名 -> 转换失败时的异常，成功时为None
+        """
+        out_dir = tempfile.mkdtemp(prefix="soffice-out-")
+        try:
+            # 一次调用转换同一格式的所有文件
+            subprocess.run(
+                [
+                    self.__program, "--headless", "--norestore", "--nologo",
+                    "-env:UserInstallation=file:///" + self.__profile.replace('\\', '/').lstrip('/'),
+                    "--convert-to", soffice_filter, "--outdir", out_dir,
+                ] + [file for file, _ in group],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=self.__timeout, check=False
+            )
+            for file, file_new in group:
+                produced = path.join(out_dir, path.splitext(path.basename(file))[0] + new_suffix)
+                if path.exists(produced):
+                    shutil.move(produced, file_new)
+                    errors[file] = None
+                else:
+                    errors[file] = RuntimeError(f"soffice failed to convert {file}")
+        except Exception as e:
+            for file, _ in group:
+                errors.setdefault(file, e)
+        finally:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    def close(self) -> None:
+        shutil.rmtree(self.__profile, ignore_errors=True)
+
+
+class FakeBackend(ConverterBackend):
+    """
+    测试用转换后端：直接复制文件内容，并记录转换过的文件
+    """
+
+    def __init__(self, failures: List[str] = ()):
+        """
+        :param failures: 需要模拟转换失败的源文件名
+        """
+        self.__failures = set(failures)
+        self.__converted: List[Tuple[str, str]] = []
+
+    def convert(self, file: str, file_new: str) -> None:
+        if file in self.__failures:
+            raise RuntimeError(f"can not turn {file}")
+        shutil.copyfile(file, file_new)
+        self.__converted.append((file, file_new))
+
+    @property
+    def converted(self):
+        return self.__converted
+
+
+def default_backend() -> ConverterBackend:
+    """
+    按运行环境选择转换后端：优先使用本机 Office，其次使用 LibreOffice
+    """
+    if win32 is not None:
+        return Win32Backend()
+    return SofficeBackend()
+
+
+class ConvertStore(object):
+    """
+    转换结果的内容寻址存储：以旧格式文件内容的摘要为键保存转换后的文件，
+    内容相同的文件再次转换时直接硬链接（或复制）已有结果，无需再经过 Office
+    总大小超过上限时按最近使用时间淘汰
+    """
+
+    def __init__(self, store_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        """
+        :param store_dir: 存储目录（绝对路径），一般位于日志目录下
+        :param max_bytes: 存储的总大小上限（字节）
+        """
+        self.__store_dir = store_dir
+        self.__max_bytes = max_bytes
+        self.__conn = None
+
+    def __connect(self) -> sqlite3.Connection:
+        if self.__conn is None:
+            if not path.exists(self.store_dir):
+                os.makedirs(self.store_dir)
+            # 多个进程可能同时读写同一个存储；扫描流水线中由转换线程使用，由扫描线程关闭
+            self.__conn = sqlite3.connect(path.join(self.store_dir, "index.sqlite3"), timeout=30, isolation_level=None, check_same_thread=False)
+            self.__conn.execute(
+                "CREATE TABLE IF NOT EXISTS store ("
+                "digest TEXT, suffix TEXT, size INTEGER, used REAL, "
+                "PRIMARY KEY (digest, suffix))"
+            )
+        return self.__conn
+
+    def __store_file(self, digest: str, suffix: str) -> str:
+        return path.join(self.store_dir, digest[:2], digest + suffix)
+
+    def fetch(self, digest: str, file_new: str) -> bool:
+        """
+        若存储中有该摘要对应的转换结果，则将其链接（或复制）为 file_new
+        :param digest: 旧格式文件内容的摘要
+        :param file_new: 转换后的文件名（绝对路径）
+        :return: 是否命中
+        """
+        suffix = path.splitext(file_new)[1]
+        store_file = self.__store_file(digest, suffix)
+        try:
+            conn = self.__connect()
+            row = conn.execute("SELECT size FROM store WHERE digest=? AND suffix=?", (digest, suffix)).fetchone()
+            # 硬链接的文件被原地修改后大小会变化，此时视为未命中
+            if row is None or not path.exists(store_file) or path.getsize(store_file) != row[0]:
+                return False
+            try:
+                os.link(store_file, file_new)
+            except OSError:
+                shutil.copyfile(store_file, file_new)
+            conn.execute("UPDATE store SET used=? WHERE digest=? AND suffix=?", (time.time(), digest, suffix))
+        except (OSError, sqlite3.Error):
+            return False
+        return True
+
+    def lookup(self, digest: str, suffix: str) -> Union[str, None]:
+        """
+        只读地查询存储中的转换结果，不更新使用时间
+        :param digest: 旧格式文件内容的摘要
+        :param suffix: 转换后的后缀，如 ".docx"
+        :return: 存储中的文件名（绝对路径），未命中时为None
+        """
+        store_file = self.__store_file(digest, suffix)
+        if not path.exists(path.join(self.store_dir, "index.sqlite3")):
+            return None
+        try:
+            row = self.__connect().execute("SELECT size FROM store WHERE digest=? AND suffix=?", (digest, suffix)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or not path.exists(store_file) or path.getsize(store_file) != row[0]:
+            return None
+        return store_file
+
+    def put(self, digest: str, file_new: str) -> None:
+        """
+        将转换结果保存到存储中
+        :param digest: 旧格式文件内容的摘要
+        :param file_new: 转换后的文件名（绝对路径）
+        """
+        suffix = path.splitext(file_new)[1]
+        store_file = self.__store_file(digest, suffix)
+        try:
+            conn = self.__connect()
+            if not path.exists(path.dirname(store_file)):
+                os.makedirs(path.dirname(store_file), exist_ok=True)
+            # 先写入临时文件再替换，避免其他进程读到不完整的文件
+            fd, tmp_file = tempfile.mkstemp(dir=path.dirname(store_file))
+            os.close(fd)
+            shutil.copyfile(file_new, tmp_file)
+            os.replace(tmp_file, store_file)
+            conn.execute("INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?)", (digest, suffix, path.getsize(store_file), time.time()))
+        except (OSError, sqlite3.Error):
+            pass
+
+    def evict(self) -> None:
+        """
+        按最近使用时间从旧到新淘汰，直到总大小不超过上限
+        """
+        try:
+            conn = self.__connect()
+            rows = conn.execute("SELECT digest, suffix, size FROM store ORDER BY used").fetchall()
+            total = sum(row[2] for row in rows)
+            for digest, suffix, size in rows:
+                if total <= self.__max_bytes:
+                    break
+                try:
+                    os.remove(self.__store_file(digest, suffix))
+                except FileNotFoundError:
+                    pass
+                conn.execute("DELETE FROM store WHERE digest=? AND suffix=?", (digest, suffix))
+                total -= size
+        except (OSError, sqlite3.Error):
+            pass
+
+    def close(self) -> None:
+        if self.__conn is not None:
+            self.__conn.close()
+            self.__conn = None
+
+    @property
+    def store_dir(self):
+        return self.__store_dir
+
+
+class ConverterPool(object):
+    """
+    转换会话池：会话在首次使用时创建，之后在多个文件、多个线程之间复用
+    """
+
+    def __init__(self, factory: Callable[[], ConverterBackend] = default_backend, size: int = 1):
+        """
+        :param factory: 创建转换后端（会话）的函数
+        :param size: 最多同时存在的会话数
+        """
+        self.__factory = factory
+        self.__size = size
+        self.__created = 0
+        self.__idle = queue.LifoQueue()
+        self.__backends: List[ConverterBackend] = []
+        self.__targets: Set[str] = set()  # 由本池转换得到的文件名，其他文件转换后与之同名时另取文件名
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def session(self):
+        """
+        借用一个转换会话，用完自动归还
+        """
+        backend = None
+        try:
+            backend = self.__idle.get_nowait()
+        except queue.Empty:
+            with self.__lock:
+                if self.__created < self.__size:
+                    self.__created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    backend = self.__factory()
+                except Exception:
+                    with self.__lock:
+                        self.__created -= 1
+                    raise
+                with self.__lock:
+                    self.__backends.append(backend)
+            else:
+                backend = self.__idle.get()
+        try:
+            yield backend
+        finally:
+            self.__idle.put(backend)
+
+    def convert(self, file: str) -> str:
+        """
+        转换单个旧格式文件，转换成功后删除源文件；已有同名的新格式文件时不转换，也不删除源文件
+        :param file: 文件名（绝对路径）
+        :return: 转换后的文件名（绝对路径）
+        """
+        file_new = converted_name(file)
+        if path.exists(file_new):
+            # 已有同名的新格式文件，不是由该文件转换得到的，保留源文件
+            return file_new
+        with self.session() as backend:
+            backend.convert(file, file_new)
+        journal.note("convert", src=file, dst=file_new)
+        os.remove(file)
+        return file_new
+
+    def convert_batch(self, files: List[str], store: ConvertStore = None) -> Dict[str, Union[str, Exception]]:
+        """
+        在同一个会话中转换多个旧格式文件，转换成功的源文件被删除（已有同名新格式文件的源文件保留）；
+        转换结果与同一批或之前转换得到的文件同名（如 a.doc 与 a.wps）时，在文件名前加上序号
+        :param files: 包含文件名（绝对路径）的列表
+        :param store: 转换结果存储，内容相同的文件直接使用已有结果；为None时不使用
+        :return: 源文件名 -> 转换后的文件名，转换失败时为对应的异常
+        """
+        results: Dict[str, Union[str, Exception]] = {}
+        digests: Dict[str, str] = {}
+        produced = []  # 由转换或转换结果存储得到新格式文件的源文件
+        reserved: Set[str] = set()  # 本批已占用的目的文件名
+        pairs = []
+        for file in files:
+            file_new = converted_name(file)
+            if path.exists(file_new) and file_new not in self.__targets:
+                # 已有同名的新格式文件，不是由转换得到的，保留源文件
+                results[file] = file_new
+                continue
+            file_new = reserve_name(file_new, reserved)
+            if store is not None:
+                try:
+                    digests[file] = file_digest(file)
+                except OSError as e:
+                    results[file] = e
+                    continue
+                if store.fetch(digests[file], file_new):
+                    results[file] = file_new
+                    produced.append(file)
+                    continue
+            pairs.append((file, file_new))
+        if pairs:
+            try:
+                with self.session() as backend:
+                    errors = backend.convert_batch(pairs)
+            except Exception as e:
+                errors = {file: e for file, _ in pairs}
+            for file, file_new in pairs:
+                results[file] = errors[file] if errors[file] is not None else file_new
+                if errors[file] is None:
+                    produced.append(file)
+                    if store is not None:
+                        store.put(digests[file], file_new)
+            if store is not None:
+                store.evict()
+        for file in produced:
+            if not isinstance(results[file], Exception):
+                with self.__lock:
+                    self.__targets.add(results[file])
+                try:
+                    journal.note("convert", src=file, dst=results[file])
+                    os.remove(file)
+                except OSError as e:
+                    results[file] = e
+        return results
+
+    def close(self) -> None:
+        """
+        关闭所有会话，之后再次使用时重新创建会话
+        """
+        with self.__lock:
+            backends, self.__backends = self.__backends, []
+            self.__created = 0
+            self.__targets.clear()
+            while True:
+                try:
+                    self.__idle.get_nowait()
+                except queue.Empty:
+                    break
+        for backend in backends:
+            backend.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConverterPool:
+    """
+    当前进程使用的转换会话池，未设置时按运行环境创建
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConverterPool()
+        return _pool
+
+
+def set_pool(pool: ConverterPool) -> None:
+    """
+    替换当前进程使用的转换会话池（如测试时使用 FakeBackend）
+    :param pool: 新的转换会话池
+    """
+    global _pool
+    with _pool_lock:
+        old, _pool = _pool, pool
+    if old is not None and old is not pool:
+        old.close()
+
+
+@atexit.register
+def close_pool() -> None:
+    if _pool is not None:
+        _pool.close()
@@ -6,15 +6,39 @@ import os
 import os.path as path
 import shutil
 import time
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pformat
-from typing import List, Dict
+from typing import List, Dict, Tuple, Union
 
+from . import convert
+from . import journal
 from . import utils
+from .cache import ClassifyCache
+from .downscale import PhotoScaler
+from .journal import VillageJournal
+from .manifest import VillageManifest
+
+
+# Village 各处理阶段的依赖关系：
+# excel01 需要 word01 拆分得到的各户附件1；word02 未找到源文件时使用 word01 剩下的整体文档；excel02 需要 word02
+VILLAGE_STAGE_DEPENDENCIES = {
+    "word01": (),
+    "word02": ("word01",),
+    "excel01": ("word01",),
+    "excel02": ("word02",),
+    "photos": (),
+    "downscale": ("photos",),
+}
+# 最多解压几层嵌套的压缩包
+ZIP_MAX_DEPTH = 3
+# 缩小照片生成的副本所在的文件夹（见 PhotoScaler），不是上传的文件，扫描时不移入暂存也不删除
+SCALED_PHOTOS_DIR = "照片-压缩"
 
 
 class Village:
 
-    def __init__(self, root_path: str, region_name: str, town_name: str, village_name: str, log_path: str):
+    def __init__(self, root_path: str, region_name: str, town_name: str, village_name: str, log_path: str, dedup_photos: bool = False,
+                 photo_scaler: PhotoScaler = None):
         self.__states = {
             "word01_handled": False,
             "word02_handled": False,
@@ -28,10 +52,130 @@ class Village:
         self.__village_name = village_name
         self.__log_path = log_path
         self.__path = path.join(root_path, region_name, town_name, village_name)
-        self.__substances = self.__scan__()
+        self.__word01_records = None  # 拆分附件1时得到的各户记录，供 excel01_handle 直接使用
+        self.__substances = None  # 首次访问 substances 时才进行扫描
+        self.__inputs: List[utils.FileRecord] = []  # 扫描得到的文件记录，写入处理结果清单
+        self.__dedup_photos = dedup_photos  # 是否去除同一户中内容相同的照片
+        self.__photo_duplicates: Dict[str, str] = {}  # 去除的重复照片 -> 保留的照片
+        self.__photo_scaler = photo_scaler  # 照片放入"照片"文件夹后进行缩小，为None时不处理
+        self.__photo_bytes_saved = 0  # 缩小照片节省的字节数
         # self.check_all()
 
     def __scan__(self):
+        substances = utils.Substances(("photos", "word01", "word02", "excel01", "excel02", "cache"))
+        classify_cache = ClassifyCache(path.join(self.log_path, "classify_cache.sqlite3"))
+        convert_store = convert.ConvertStore(path.join(self.log_path, "convert_store"))
+        sources: Dict[str, utils.FileEntry] = {}  # 暂存中的文件名（含转换后的文件名） -> 原始文件
+
+        def discover():
+            staging, dst_path = self.__staging_plan(), path.join(self.path, "暂存")
+            if not path.exists(dst_path):
+                os.mkdir(dst_path)
+            # 将所有文件移动至暂存文件夹
+            journal.rename_batch([(entry.path, renamed_file) for entry, renamed_file in staging])
+            for old_dir in os.listdir(self.path):
+                # 将除"暂存"与缩小照片的副本之外的文件夹全部删除
+                if old_dir not in ("暂存", SCALED_PHOTOS_DIR):
+                    shutil.rmtree(path.join(self.path, old_dir))
+            # 按文件内容纠正后缀，避免不必要的转换和误判；全部纠正完成后再交给转换阶段，避免与转换结果重名
+            files = []
+            for entry, renamed_file in staging:
+                file = utils.fix_suffix(renamed_file)
+                sources[file] = entry
+                files.append(file)
+            # 解压压缩包中需要的成员（包括嵌套的压缩包），压缩包本身仍放入暂存；
+            # 只解压以 .zip 上传的压缩包，之前运行时已放入暂存的压缩包已经解压过，不再重复解压
+            archives = [
+                (file, 1) for file in files
+                if file.lower().endswith('.zip') and sources[file].name.lower().endswith('.zip') and path.dirname(sources[file].path) != dst_path
+            ]
+            while archives:
+                archive, depth = archives.pop(0)
+                for extracted in utils.extract_zip(archive, dst_path):
+                    file = utils.fix_suffix(extracted)
+                    sources[file] = sources[archive]
+                    files.append(file)
+                    if file.lower().endswith('.zip') and extracted.lower().endswith('.zip') and depth < ZIP_MAX_DEPTH:
+                        archives.append((file, depth + 1))
+            yield from files
+
+        # 转换旧格式文件的同时解析已转换好的文件，内容相同的文件直接使用已有的转换结果
+        try:
+            # 转换结果可能因重名另取文件名，由转换阶段登记其原始文件
+            pipeline = utils.ScanPipeline(lambda file: self.__classify(classify_cache, file), convert_store,
+                                          on_convert=lambda file, file_new: sources.setdefault(file_new, sources[file]))
+            for kind, file in pipeline.run(discover()):
+                # 原文件已移动至暂存，大小以暂存中的文件为准；分类与转换时已计算过摘要的文件不会再次读取
+                substances.add(file, kind, path.getsize(file), sources[file].path, convert.file_digest(file))
+        finally:
+            convert_store.close()
+            classify_cache.close()
+        return substances
+
+    def __staging_plan(self) -> List[Tuple[utils.FileEntry, str]]:
+        """
+        所有文件移动至暂存文件夹后的文件名（缩小照片的副本除外）
+        :return: 由 (原文件, 暂存中的文件名) 组成的列表
+        """
+        dst_path = path.join(self.path, "暂存")
+        file_names_dic: Dict[str, int] = {}  # 避免文件名重复
+        staging = []
+        for entry in self.__walk_inputs():
+            file_name = entry.name
+            if file_name not in file_names_dic.keys():
+                file_names_dic[file_name] = 1
+                renamed_file = path.join(dst_path, file_name)
+            else:
+                file_names_dic[file_name] += 1
+                renamed_file = path.join(dst_path, f"{file_names_dic[file_name]:02d}-{file_name}")
+            staging.append((entry, renamed_file))
+        return staging
+
+    def __walk_inputs(self):
+        """
+        查找村目录下除缩小照片的副本之外的所有文件，顺序与 utils.walk_files 相同
+        :return: 逐个产生 FileEntry 的生成器
+        """
+        for entry in utils.list_dir(self.path):
+            if not entry.is_dir:
+                yield entry
+            elif entry.name != SCALED_PHOTOS_DIR:
+                yield from utils.walk_files(entry.path)
+
+    @staticmethod
+    def __classify(classify_cache: ClassifyCache, file: str, source: str = None) -> List[str]:
+        """
+        对文件进行分类
+        :param file: 按其后缀分类的文件名（绝对路径）
+        :param source: 实际读取内容的文件名，为None时与 file 相同
+        :return: 所属类别列表
+        """
+        source = source or file
+        if not (file.startswith('~$') or file.startswith('.')) and (file.endswith('doc') or file.endswith('docx') or file.endswith('.wps')):
+            docx_serial = classify_cache.docx01_or_docx02(source)
+            if docx_serial == 1:
+                return ["word01"]
+            elif docx_serial == 2:
+                return ["word02"]
+            elif docx_serial == 3:
+                return ["cache"]
+            return []
+        elif not (file.startswith('~$') or file.startswith('.')) and (file.endswith('.xls') or file.endswith('.xlsx')):
+            return ["excel01"] if classify_cache.xlsx01_or_xlsx02(source) else ["excel02"]
+        elif file.endswith('.jpg') or file.endswith('png'):
+            return ["photos"]
+        elif file.endswith('.zip'):
+            # 需要的成员已在扫描时解压，压缩包本身放入暂存
+            return ["cache"]
+        else:
+            return ["cache"]
+
+    def inspect(self) -> dict:
+        """
+        只读检查：给出扫描后将得到的 substances 及扫描时将执行的操作，不移动、转换或删除任何文件
+        需要先转换才能确定类别的文件列在 "pending" 中
+        :return: {"substances": {...}, "actions": [(操作, 源文件, 目的文件), ...]}
+        """
         substances = {
             "photos": [],
             "word01": [],
@@ -39,79 +183,48 @@ class Village:
             "excel01": [],
             "excel02": [],
             "cache": [],
+            "pending": [],
         }
-        files, dst_path = utils.get_filepath(self.path, []), path.join(self.path, "暂存")
-        file_names = [file.split('\\')[-1] for file in files]
+        actions = []
+        dst_path = path.join(self.path, "暂存")
         if not path.exists(dst_path):
-            os.mkdir(dst_path)
-        file_names_dic: Dict[str, int] = {}  # 避免文件名重复
-        for i in range(len(files)):
-            file = files[i]
-            file_name = file_names[i]
-            # 将所有文件移动至暂存文件夹
-            if file_name not in file_names_dic.keys():
-                file_names_dic[file_name] = 1
-                renamed_file = path.join(dst_path, file_name)
-                os.rename(file, renamed_file)
-                files[i] = renamed_file
-            else:
-                file_names_dic[file_name] += 1
-                renamed_file = path.join(dst_path, f"{file_names_dic[file_name]:02d}-{file_name}")
-                os.rename(file, renamed_file)
-                files[i] = renamed_file
-        for old_dir in os.listdir(self.path):
-            # 将除"暂存"之外的文件夹全部删除
-            if old_dir != "暂存":
-                shutil.rmtree(path.join(self.path, old_dir))
-        for file in files:
-            # 将所有文件进行分类
-            if not (file.startswith('~$') or file.startswith('.')) and (file.endswith('doc') or file.endswith('docx') or file.endswith('.wps')):
-                if file.endswith('doc'):
-                    try:
-                        file = utils.doc_to_docx(file)
-                    except Exception:
-                        if file not in substances["cache"]:
-                            substances["cache"].append(file)
-                elif file.endswith('wps'):
-                    try:
-                        file = utils.wps_to_docx(file)
-                    except Exception:
-                        if file not in substances["cache"]:
-                            substances["cache"].append(file)
-                docx_serial = utils.docx01_or_docx02(file)
-                if docx_serial == 1:
-                    if file not in substances["word01"]:
-                        substances["word01"].append(file)
-                elif docx_serial == 2:
-                    if file not in substances["word02"]:
-                        substances["word02"].append(file)
-                elif docx_serial == 3:
-                    if file not in substances["cache"]:
-                        substances["cache"].append(file)
-            elif not (file.startswith('~$') or file.startswith('.')) and (file.endswith('.xls') or file.endswith('.xlsx')):
-                if file.endswith('.xls'):
-                    try:
-                        file = utils.xls_to_xlsx(file)
-                    except Exception:
-                        if file not in substances["cache"]:
-                            substances["cache"].append(file)
-                if utils.xlsx01_or_xlsx02(file):
-                    if file not in substances["excel01"]:
-                        substances["excel01"].append(file)
-                else:
-                    if file not in substances["excel02"]:
-                        substances["excel02"].append(file)
-            elif file.endswith('.jpg') or file.endswith('png'):
-                if file not in substances["photos"]:
-                    substances["photos"].append(file)
-            elif file.endswith('.zip'):
-                # TODO
-                if file not in substances["cache"]:
-                    substances["cache"].append(file)
-            else:
-                if file not in substances["cache"]:
-                    substances["cache"].append(file)
-        return substances
+            actions.append(("mkdir", dst_path, ""))
+        classify_cache = ClassifyCache(path.join(self.log_path, "classify_cache.sqlite3"), read_only=True)
+        convert_store = convert.ConvertStore(path.join(self.log_path, "convert_store"))
+        try:
+            staging = self.__staging_plan()
+            planned = {renamed_file for _, renamed_file in staging}  # 暂存中将要存在的文件名
+            archives = []
+            for entry, renamed_file in staging:
+                file = entry.path
+                if renamed_file != file:
+                    actions.append(("move", file, renamed_file))
+                renamed_file, kinds = inspect_file(
+                    file, renamed_file, lambda name, source: self.__classify(classify_cache, name, source), convert_store, actions
+                )
+                for kind in kinds if kinds is not None else ["pending"]:
+                    if renamed_file not in substances[kind]:
+                        substances[kind].append(renamed_file)
+                if renamed_file.lower().endswith('.zip') and entry.name.lower().endswith('.zip') and path.dirname(file) != dst_path:
+                    archives.append(file)
+            for file in archives:
+                # 只列出第一层压缩包中的成员，解压前无法读取内容进行分类
+                for info, name in utils.zip_plan(file):
+                    member_file, n = path.join(dst_path, name), 1
+                    while member_file in planned:
+                        n += 1
+                        member_file = path.join(dst_path, f"{n:02d}-{name}")
+                    planned.add(member_file)
+                    actions.append(("extract", f"{file}/{utils.zip_member_name(info)}", member_file))
+                    substances["pending"].append(member_file)
+        finally:
+            convert_store.close()
+            classify_cache.close()
+        for entry in utils.list_dir(self.path):
+            # 文件已在上面列为移动，扫描时只删除除"暂存"之外的文件夹
+            if entry.is_dir and entry.name not in ("暂存", SCALED_PHOTOS_DIR):
+                actions.append(("rmtree", entry.path, ""))
+        return {"substances": substances, "actions": actions}
 
     def word01_handle(self):
         """
@@ -121,6 +234,7 @@ class Village:
         if not path.exists(path_to_store):
             os.mkdir(path_to_store)
         word01_ls = self.substances["word01"]
+        records = dict()
         if len(word01_ls) == 0:
             # 未找到 word01
             try:
@@ -131,16 +245,17 @@ class Village:
         elif len(word01_ls) == 1:
             # 所有 word01 统一存在一个文档中
             try:
-                utils.VillageWord01Handle.case01(path_to_store, word01_ls[0])
+                utils.VillageWord01Handle.case01(path_to_store, word01_ls[0], records=records)
             except Exception:
                 return
         else:
             # 所有 word01 分别存在一个单独的文档中
             try:
-                utils.VillageWord01Handle.case02(path_to_store, word01_files_ls=word01_ls)
+                utils.VillageWord01Handle.case02(path_to_store, word01_files_ls=word01_ls, records=records)
             except Exception:
                 return
         self.states["word01_handled"] = True
+        self.__word01_records = records
         self.substances["word01"] = [path.join(path_to_store, d) for d in os.listdir(path_to_store)]
         if len(word01_ls) == 1:
             self.substances["word01"].append(word01_ls[0])
@@ -189,10 +304,13 @@ class Village:
                         self.region_name,
                         self.town_name,
                         self.village_name,
-                        path.join(self.path, "附件1-单体抗震性能调查表")
+                        path.join(self.path, "附件1-单体抗震性能调查表"),
+                        records=self.__word01_records
                     )
                 except Exception:
                     return
+                finally:
+                    self.__word01_records = None
             else:
                 return
         elif len(excel01_ls) == 1:
@@ -250,14 +368,108 @@ class Village:
         else:
             # 找到照片
             try:
-                utils.VillagePhotosHandle.case01(path_to_store, photo_files_ls=photos_ls)
+                self.__photo_duplicates = utils.VillagePhotosHandle.case01(path_to_store, photo_files_ls=photos_ls, dedup=self.dedup_photos)
             except Exception:
                 return
         self.states["photos_handled"] = True
         self.substances["photos"] = [path.join(path_to_store, d) for d in os.listdir(path_to_store)]
 
+    def downscale_handle(self):
+        """
+        照片整理完成后缩小照片，已处理过的照片记录在日志目录下的索引中
+        """
+        if self.photo_scaler is None or not self.states["photos_handled"]:
+            return
+        index_file = path.join(self.log_path, "downscale", f"{self.region_name}-{self.town_name}-{self.village_name}.json")
+        self.__photo_bytes_saved = self.photo_scaler.scale(path.join(self.path, "照片"), index_file)
+
+    def stages_handle(self, workers: int = 3) -> None:
+        """
+        按 VILLAGE_STAGE_DEPENDENCIES 处理各项内容，互不依赖的阶段（如照片与附件）并发执行，
+        各阶段的处理结果记录在 states 中
+        :param workers: 最多同时执行的阶段数，为 1 时与依次调用各 handle 方法相同
+        """
+        # 在并发执行各阶段之前完成扫描
+        self.substances
+        journal.note("scanned", sync=True)
+
+        def staged(name: str, task):
+            def run():
+                journal.note("stage", name=name, state="begin")
+                task()
+                journal.note("stage", sync=True, name=name, state="done", states=dict(self.states))
+            return run
+
+        outcomes = utils.run_stages(
+            {
+                "word01": staged("word01", self.word01_handle),
+                "word02": staged("word02", self.word02_handle),
+                "excel01": staged("excel01", self.excel01_handle),
+                "excel02": staged("excel02", self.excel02_handle),
+                "photos": staged("photos", self.photos_handle),
+                "downscale": staged("downscale", self.downscale_handle),
+            },
+            VILLAGE_STAGE_DEPENDENCIES,
+            workers
+        )
+        for error in outcomes.values():
+            if error is not None:
+                raise error
+
+    def manifest_restore(self) -> bool:
+        """
+        若该村上次已全部处理完成，且村目录与处理结果清单一致，则直接恢复 states 与 substances，无需扫描和处理
+        :return: 是否已恢复
+        """
+        manifest = VillageManifest(self.log_path, self.region_name, self.town_name, self.village_name).match(self.path, self.states, self.options)
+        if manifest is None:
+            return False
+        self.restore(manifest["states"], manifest["substances"])
+        return True
+
+    def restore(self, states: Dict[str, bool], substances: Dict[str, List[str]] = None) -> None:
+        """
+        直接恢复之前的处理结果，不再扫描
+        :param states: 处理状态
+        :param substances: 类别 -> 文件名列表（相对于村目录，以 '/' 分隔）
+        """
+        substances = substances or {}
+        self.states.update(states)
+        self.__substances = utils.Substances(list(substances) + [kind for kind in ("cache",) if kind not in substances])
+        for kind, files in substances.items():
+            self.__substances[kind] = [path.join(self.path, *file.split('/')) for file in files]
+
+    def rollback(self, village_journal: VillageJournal) -> None:
+        """
+        撤销上次中断时处理到一半的结果：删除生成的文件，把移动过的文件放回原位置
+        :param village_journal: 该村的处理日志
+        """
+        generated = [path.join(self.path, name) for name in ("附件2-整体抗震性能统计表.docx", "单体抗震性能调查表.xlsx", "整体抗震性能统计表.xlsx")]
+        output_dirs = [path.join(self.path, name) for name in ("附件1-单体抗震性能调查表", "照片", SCALED_PHOTOS_DIR, "暂存")]
+        for output_dir in output_dirs:
+            if path.isdir(output_dir):
+                generated.extend(entry.path for entry in utils.walk_files(output_dir))
+        village_journal.rollback(generated)
+        for output_dir in output_dirs:
+            # 删除处理过程中建立的空文件夹
+            for dir_path, _, _ in os.walk(output_dir, topdown=False):
+                if not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+
+    def manifest_write(self) -> None:
+        """
+        该村全部处理完成时写入处理结果清单，否则删除旧的清单
+        """
+        manifest = VillageManifest(self.log_path, self.region_name, self.town_name, self.village_name)
+        if all(self.states.values()):
+            manifest.write(self.path, self.states, self.__inputs, self.substances, self.options)
+        else:
+            manifest.remove()
+
     def log_write(self):
         now_time = time.strftime("%Y-%m-%d-%Hh%Mm%Ss-", time.localtime())
+        log_file_name = path.join(self.log_path, f"{self.region_name}-{self.town_name}-{self.village_name}-{now_time}log.txt")
+        log_file_name = log_file_name.replace('\\', '/')
         if self.states == {
             "word01_handled": True,
             "word02_handled": True,
@@ -266,8 +478,6 @@ class Village:
             "excel02_handled": True,
         }:
             if "未知" in os.listdir(path.join(self.path, "照片")):
-                log_file_name = path.join(self.log_path, f"{self.region_name}-{self.town_name}-{self.village_name}-{now_time}log.txt")
-                log_file_name = log_file_name.replace('\\', '/')
                 with open(log_file_name, "w") as log_file:
                     log_file.write("********************************************************************\n")
                     log_file.write(f"区名：{self.region_name}\n")
@@ -281,8 +491,6 @@ class Village:
                     log_file.write("--------------\n")
                     log_file.write("********************************************************************\n")
         else:
-            log_file_name = path.join(self.log_path, f"{self.region_name}-{self.town_name}-{self.village_name}-{now_time}log.txt")
-            log_file_name = log_file_name.replace('\\', '/')
             with open(log_file_name, "w") as log_file:
                 log_file.write("********************************************************************\n")
                 log_file.write(f"区名：{self.region_name}\n")
@@ -314,6 +522,30 @@ class Village:
                     log_file.write("照片未完成整理\n")
                     log_file.write("--------------\n")
                 log_file.write("********************************************************************\n")
+        if self.photo_duplicates:
+            self.__log_append(log_file_name, "重复照片（已去除 -> 保留）：\n{}\n".format(pformat({
+                path.basename(file): path.relpath(kept, self.path) for file, kept in self.photo_duplicates.items()
+            })))
+        if self.photo_scaler is not None:
+            self.__log_append(log_file_name, f"照片缩小节省：{self.photo_bytes_saved / 1024 / 1024:.1f} MB（{self.photo_bytes_saved} 字节）\n")
+
+    def __log_append(self, log_file_name: str, content: str) -> None:
+        """
+        向日志文件追加一段内容，日志文件不存在时先写入区、镇、村名
+        :param log_file_name: 日志文件名
+        :param content: 追加的内容
+        """
+        with open(log_file_name, "a") as log_file:
+            if log_file.tell() == 0:
+                log_file.write("********************************************************************\n")
+                log_file.write(f"区名：{self.region_name}\n")
+                log_file.write(f"镇名：{self.town_name}\n")
+                log_file.write(f"村名：{self.village_name}\n")
+                log_file.write("********************************************************************\n")
+            log_file.write("--------------\n")
+            log_file.write(content)
+            log_file.write("--------------\n")
+            log_file.write("********************************************************************\n")
 
     def clean_cache(self) -> None:
         """
@@ -332,6 +564,31 @@ class Village:
     def states(self):
         return self.__states
 
+    @property
+    def dedup_photos(self):
+        return self.__dedup_photos
+
+    @property
+    def options(self):
+        # 影响处理结果的运行选项，记录在处理结果清单中，与上次不同时需要重新处理
+        scaler = self.photo_scaler
+        return {
+            "dedup_photos": self.dedup_photos,
+            "downscale": None if scaler is None else {"max_edge": scaler.max_edge, "quality": scaler.quality, "replace": scaler.replace},
+        }
+
+    @property
+    def photo_duplicates(self):
+        return self.__photo_duplicates
+
+    @property
+    def photo_scaler(self):
+        return self.__photo_scaler
+
+    @property
+    def photo_bytes_saved(self):
+        return self.__photo_bytes_saved
+
     @property
     def root_path(self):
         return self.__root_path
@@ -358,9 +615,77 @@ class Village:
 
     @property
     def substances(self):
+        if self.__substances is None:
+            self.__substances = self.__scan__()
+            self.__inputs = [record for files in self.__substances.values() for record in files.records()]
         return self.__substances
 
 
+def inspect_file(source: str, file: str, classify, convert_store: convert.ConvertStore, actions: List[Tuple[str, str, str]]) -> Tuple[str, Union[List[str], None]]:
+    """
+    只读地判断文件扫描后的文件名与类别，并记录扫描时将对其执行的重命名与转换
+    :param source: 文件当前的文件名（绝对路径）
+    :param file: 扫描时文件所在的位置（如移动至暂存后）
+    :param classify: 分类函数 (按其后缀分类的文件名, 实际读取内容的文件名) -> 类别列表
+    :param convert_store: 转换结果存储，已有转换结果的旧格式文件按转换结果分类
+    :param actions: 记录操作的列表
+    :return: (扫描后的文件名, 类别列表)，需要先转换才能确定类别时类别列表为None
+    """
+    suffix = utils.sniff_suffix(source)
+    if suffix is not None:
+        file_new = path.splitext(file)[0] + suffix
+        actions.append(("rename", file, file_new))
+        file = file_new
+    if file.endswith(tuple(convert.CONVERT_SUFFIXES)):
+        file_new = convert.converted_name(file)
+        actions.append(("convert", file, file_new))
+        stored = convert_store.lookup(convert.file_digest(source), path.splitext(file_new)[1])
+        if stored is None:
+            return file_new, None
+        return file_new, classify(file_new, stored)
+    if source.endswith(tuple(convert.CONVERT_SUFFIXES)):
+        # 内容已是新格式但后缀仍为旧格式，直接读取会触发转换
+        return file, None
+    return file, classify(file, source)
+
+
+def handle_village(root_path: str, region_name: str, town_name: str, village_name: str, log_path: str, resume: bool = False,
+                   dedup_photos: bool = False, photo_scaler: PhotoScaler = None) -> Village:
+    """
+    完整处理一个村（可在子进程中运行）
+    :param root_path: 数据根目录
+    :param region_name: 区名
+    :param town_name: 镇名
+    :param village_name: 村名
+    :param log_path: 日志存储路径
+    :param resume: 是否从上次中断处继续：回滚处理到一半的村后重新处理（已处理完成的村是否跳过由处理结果清单决定）
+    :param dedup_photos: 是否去除同一户中内容相同的照片
+    :param photo_scaler: 照片缩小的设置，为None时不缩小照片
+    :return: 处理完成的 Village 对象，其 states 与 substances 记录了处理结果
+    """
+    village = Village(root_path, region_name, town_name, village_name, log_path, dedup_photos, photo_scaler)
+    village_journal = VillageJournal(log_path, region_name, town_name, village_name)
+    if resume and village_journal.state() == "interrupted":
+        village.rollback(village_journal)
+    if village.manifest_restore():
+        # 上次已处理完成且之后没有变化；已完成但之后有新上传或改动的村仍需重新处理
+        return village
+    village_journal.begin()
+    journal.set_journal(village_journal)
+    try:
+        village.stages_handle()
+        village.log_write()
+        village.clean_cache()
+        village.manifest_write()
+        village_journal.end(village.states)
+    finally:
+        journal.set_journal(None)
+        village_journal.close()
+        # 子进程退出时不执行 atexit，在此关闭转换会话（如删除 soffice 的用户配置目录）
+        convert.get_pool().close()
+    return village
+
+
 class Town(object):
     def __init__(self, root_path: str, region_name: str, town_name: str, log_path: str):
         self.__states = {
@@ -374,67 +699,110 @@ class Town(object):
         self.__log_path = log_path
         self.__path = path.join(root_path, region_name, town_name)
         self.__villages: List[Village] = []
-        self.__substances = self.__scan__()
+        self.__substances = None  # 首次访问 substances 时才进行扫描
         # -------------------------------------------------
 
     def __scan__(self):
+        substances = utils.Substances(("village_names", "word02", "excel01", "cache"))
+        classify_cache = ClassifyCache(path.join(self.log_path, "classify_cache.sqlite3"))
+        convert_store = convert.ConvertStore(path.join(self.log_path, "convert_store"))
+        # 按文件内容纠正后缀，避免不必要的转换和误判
+        files = []
+        sources: Dict[str, utils.FileEntry] = {}  # 纠正后缀、转换后的文件名 -> 原始文件
+        for entry in utils.list_dir(self.path):
+            if entry.is_dir:
+                substances["village_names"].append(entry.name)
+            else:
+                file = utils.fix_suffix(entry.path)
+                sources[file] = entry
+                files.append(file)
+
+        def on_failure(file: str, error: Exception):
+            print(f"can not turn {file}")
+
+        try:
+            pipeline = utils.ScanPipeline(lambda file: self.__classify(classify_cache, file), convert_store, on_failure,
+                                          on_convert=lambda file, file_new: sources.setdefault(file_new, sources[file]))
+            for kind, file in pipeline.run(files):
+                entry = sources[file]
+                size = entry.size if path.basename(file) == entry.name else path.getsize(file)
+                substances.add(file, kind, size, entry.path)
+        finally:
+            convert_store.close()
+            classify_cache.close()
+        return substances
+
+    @staticmethod
+    def __classify(classify_cache: ClassifyCache, file: str, source: str = None) -> List[str]:
+        """
+        对文件进行分类
+        :param file: 按其后缀分类的文件名（绝对路径）
+        :param source: 实际读取内容的文件名，为None时与 file 相同
+        :return: 所属类别列表
+        """
+        source = source or file
+        # 格式纠正
+        if file.endswith('.doc') or file.endswith('.docx') or file.endswith('.wps'):
+            return ["word02"] if classify_cache.docx01_or_docx02(source) == 2 else ["cache"]
+        elif file.endswith('.xls') or file.endswith('.xlsx'):
+            return ["excel01"] if classify_cache.xlsx01_or_xlsx02(source) else ["cache"]
+        else:
+            return ["cache"]
+
+    def inspect(self) -> dict:
+        """
+        只读检查：给出扫描后将得到的 substances 及扫描时将执行的操作，不重命名、转换任何文件
+        需要先转换才能确定类别的文件列在 "pending" 中
+        :return: {"substances": {...}, "actions": [(操作, 源文件, 目的文件), ...]}
+        """
         substances = {
             "village_names": [],
             "word02": [],
             "excel01": [],
             "cache": [],
+            "pending": [],
         }
-        for ele_dir in os.listdir(self.path):
-            ele_path = path.join(self.path, ele_dir)
-            # 格式纠正
-            if path.isdir(ele_path):
-                substances["village_names"].append(ele_dir)
-            elif path.isfile(ele_path):
-                file = ele_path
-                if file.endswith('.doc') or file.endswith('.docx') or file.endswith('.wps'):
-                    if file.endswith('.doc'):
-                        try:
-                            file = utils.doc_to_docx(file)
-                        except Exception:
-                            print(f"can not turn {file}")
-                            substances['cache'].append(file)
-                    elif file.endswith('.wps'):
-                        try:
-                            file = utils.wps_to_docx(file)
-                        except Exception:
-                            print(f"can not turn {file}")
-                            substances["cache"].append(file)
-                    docx_serial = utils.docx01_or_docx02(file)
-                    if docx_serial == 2:
-                        substances["word02"].append(file)
-                    else:
-                        substances["cache"].append(file)
-                elif file.endswith('.xls') or file.endswith('.xlsx'):
-                    if file.endswith('.xls'):
-                        try:
-                            file = utils.xls_to_xlsx(file)
-                        except Exception:
-                            print(f"can not turn {file}")
-                            substances["cache"].append(file)
-                    if utils.xlsx01_or_xlsx02(file):
-                        substances["excel01"].append(file)
-                    else:
-                        substances["cache"].append(file)
-                else:
-                    substances["cache"].append(file)
-        return substances
-
-    def villages_handle(self):
-        for village_name in self.village_names:
-            village = Village(self.root_path, self.region_name, self.town_name, village_name, self.log_path)
-            self.villages.append(village)
-            village.word01_handle()
-            village.word02_handle()
-            village.excel01_handle()
-            village.excel02_handle()
-            village.photos_handle()
-            village.log_write()
-            village.clean_cache()
+        actions = []
+        classify_cache = ClassifyCache(path.join(self.log_path, "classify_cache.sqlite3"))
+        convert_store = convert.ConvertStore(path.join(self.log_path, "convert_store"))
+        try:
+            for entry in utils.list_dir(self.path):
+                if entry.is_dir:
+                    substances["village_names"].append(entry.name)
+                    continue
+                file, kinds = inspect_file(
+                    entry.path, entry.path, lambda name, source: self.__classify(classify_cache, name, source), convert_store, actions
+                )
+                for kind in kinds if kinds is not None else ["pending"]:
+                    substances[kind].append(file)
+        finally:
+            convert_store.close()
+            classify_cache.close()
+        return {"substances": substances, "actions": actions}
+
+    def villages_handle(self, workers: int = 1, resume: bool = False, dedup_photos: bool = False, photo_scaler: PhotoScaler = None):
+        """
+        处理该镇下的所有村
+        :param workers: 并行处理的进程数，小于等于 1 时逐村串行处理
+        :param resume: 是否从上次中断处继续，见 handle_village
+        :param dedup_photos: 是否去除同一户中内容相同的照片
+        :param photo_scaler: 照片缩小的设置，为None时不缩小照片
+        """
+        if workers <= 1:
+            for village_name in self.village_names:
+                self.villages.append(handle_village(self.root_path, self.region_name, self.town_name, village_name, self.log_path, resume, dedup_photos, photo_scaler))
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(handle_village, self.root_path, self.region_name, self.town_name, village_name, self.log_path, resume, dedup_photos, photo_scaler)
+                for village_name in self.village_names
+            ]
+            for village_name, future in zip(self.village_names, futures):
+                # 单个村处理失败不影响其他村
+                try:
+                    self.villages.append(future.result())
+                except Exception:
+                    print(f"can not handle {village_name}")
 
     def word02_handle(self):
         word02_ls = self.substances["word02"]
@@ -496,6 +864,8 @@ class Town(object):
 
     @property
     def substances(self):
+        if self.__substances is None:
+            self.__substances = self.__scan__()
         return self.__substances
 
     @property
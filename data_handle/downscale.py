@@ -0,0 +1,186 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import json
+import os
+import os.path as path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from . import move
+from . import utils
+from .manifest import relative_name
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+PHOTO_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+
+def scale_photo(file: str, file_new: str, max_edge: int, quality: int) -> int:
+    """
+    将照片缩小到最长边不超过 max_edge 并重新压缩为 JPEG；按 EXIF 方向旋转后保存，其余 EXIF 信息保留
+    （在子进程中运行）
+    :param file: 源文件名（绝对路径）
+    :param file_new: 目的文件名（绝对路径），与 file 相同时只有压缩后更小才替换原图
+    :param max_edge: 最长边的像素数
+    :param quality: JPEG 质量（1-95）
+    :return: 目的文件的字节数
+    """
+    with Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        exif = image.getexif()
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        # 先写入临时文件再替换，替换原图时中途失败不会损坏原图
+        with open(file_new + ".scaling", "wb") as f:
+            image.save(f, "JPEG", quality=quality, optimize=True, exif=exif)
+    if file_new == file and path.getsize(file_new + ".scaling") >= path.getsize(file):
+        os.remove(file_new + ".scaling")
+    else:
+        os.replace(file_new + ".scaling", file_new)
+    return path.getsize(file_new)
+
+
+def scale_job(job: Tuple[str, str, int, int]) -> Union[int, Exception]:
+    """
+    处理一张照片，无法处理（如文件损坏）时返回异常而不中断整批处理
+    :param job: scale_photo 的参数
+    :return: scale_photo 的返回值或异常
+    """
+    try:
+        return scale_photo(*job)
+    except Exception as e:
+        if path.exists(job[1] + ".scaling"):
+            os.remove(job[1] + ".scaling")
+        return e
+
+
+class PhotoScaler(object):
+    """
+    照片缩小与重新压缩：照片放入"照片"文件夹之后，由进程池生成限制尺寸的 JPEG 副本（或直接替换原图），
+    已处理的照片记录在日志目录下的索引中，再次运行时跳过
+    """
+
+    def __init__(self, max_edge: int = 2048, quality: int = 85, replace: bool = False, workers: int = 1):
+        """
+        :param max_edge: 最长边的像素数
+        :param quality: JPEG 质量（1-95）
+        :param replace: 为True时替换原图（只处理 JPEG），否则在"照片-压缩"文件夹中生成副本
+        :param workers: 进程数，小于等于 1 时在当前进程中逐张处理
+        """
+        if Image is None:
+            raise RuntimeError("Pillow is not available")
+        self.__max_edge = max_edge
+        self.__quality = quality
+        self.__replace = replace
+        self.__workers = workers
+
+    def plan(self, photo_path: str, index: Dict[str, dict]) -> List[Tuple[str, str]]:
+        """
+        找出需要处理的照片：索引中没有记录、记录后照片有变化、处理设置不同或副本已不存在的照片
+        :param photo_path: "照片"文件夹（绝对路径）
+        :param index: 已处理照片的索引
+        :return: (源文件名, 目的文件名) 的列表
+        """
+        out_path = photo_path if self.replace else photo_path + "-压缩"
+        pending = []
+        planned = set()  # 已占用的副本文件名，避免 a.jpg 与 a.png 的副本同名而互相覆盖
+        for entry in utils.walk_files(photo_path):
+            # 替换原图时只处理 JPEG，避免改变照片的文件名
+            if not entry.name.lower().endswith((".jpg", ".jpeg") if self.replace else PHOTO_SUFFIXES):
+                continue
+            record = index.get(relative_name(entry.path, photo_path))
+            output = path.join(out_path, *record.get("output", "").split('/')) if record is not None else None
+            if record is not None and record["size"] == entry.size and record["mtime"] == entry.mtime \
+                    and (record["max_edge"], record["quality"], record["replace"]) == (self.max_edge, self.quality, self.replace) \
+                    and (self.replace or path.isfile(output)):
+                planned.add(output)
+                continue
+            pending.append(entry.path)
+        jobs = []
+        for file in pending:
+            file_new = path.join(out_path, path.relpath(file, photo_path))
+            if not self.replace:
+                # 非 JPEG 的副本保留原后缀，如 a.png -> a.png.jpg
+                if path.splitext(file_new)[1].lower() != ".jpg":
+                    file_new += ".jpg"
+                dir_name, file_name = path.split(file_new)
+                n = 1
+                while file_new in planned:
+                    n += 1
+                    file_new = path.join(dir_name, f"{n:02d}-{file_name}")
+                planned.add(file_new)
+            jobs.append((file, file_new))
+        return jobs
+
+    def scale(self, photo_path: str, index_file: str) -> int:
+        """
+        处理一个村的照片
+        :param photo_path: "照片"文件夹（绝对路径）
+        :param index_file: 索引文件名（绝对路径），一般位于日志目录下
+        :return: 所有已处理照片节省的字节数（包括之前运行时处理的照片）
+        """
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        if not path.isdir(photo_path):
+            return 0
+        # 去掉已不存在的照片（同时删除其副本），以及副本已被删除（如回滚或手动删除"照片-压缩"）的照片
+        out_path = photo_path if self.replace else photo_path + "-压缩"
+        for name, record in list(index.items()):
+            output = path.join(out_path, *record.get("output", "").split('/'))
+            if not path.isfile(path.join(photo_path, *name.split('/'))):
+                if not record.get("replace") and record.get("output") and path.isfile(output):
+                    os.remove(output)
+                del index[name]
+            elif not (record.get("replace") or path.isfile(output)):
+                del index[name]
+        jobs = self.plan(photo_path, index)
+        move.make_dirs(file_new for _, file_new in jobs)
+        sizes = [path.getsize(file) for file, _ in jobs]
+        args = [(file, file_new, self.max_edge, self.quality) for file, file_new in jobs]
+        if self.workers <= 1 or len(jobs) <= 1:
+            results = [scale_job(job) for job in args]
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs))) as executor:
+                results = list(executor.map(scale_job, args, chunksize=4))
+        for (file, file_new), size, size_new in zip(jobs, sizes, results):
+            if isinstance(size_new, Exception):
+                print(f"can not scale {file}: {size_new}")
+                continue
+            # 替换原图时记录替换后的文件，下次运行时不再处理
+            stat = os.stat(file)
+            index[relative_name(file, photo_path)] = {
+                "size": stat.st_size, "mtime": stat.st_mtime, "max_edge": self.max_edge, "quality": self.quality,
+                "replace": self.replace, "output": relative_name(file_new, out_path), "saved": size - size_new,
+            }
+        if not path.exists(path.dirname(index_file)):
+            os.makedirs(path.dirname(index_file), exist_ok=True)
+        with open(index_file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=1)
+        os.replace(index_file + ".tmp", index_file)
+        return sum(record["saved"] for record in index.values())
+
+    @property
+    def max_edge(self):
+        return self.__max_edge
+
+    @property
+    def quality(self):
+        return self.__quality
+
+    @property
+    def replace(self):
+        return self.__replace
+
+    @property
+    def workers(self):
+        return self.__workers
@@ -0,0 +1,161 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import json
+import os
+import os.path as path
+import threading
+from typing import Dict, Iterable, List, Tuple, Union
+
+from . import move
+
+
+class VillageJournal(object):
+    """
+    村处理过程的预写日志，位于日志目录下，每行一条 JSON 记录：
+    begin -> move/convert（文件移动、转换，在执行之前写入）-> stage（各处理阶段开始、完成）-> end
+    运行中断后，可据此跳过已完成的村，并回滚处理到一半的村
+    """
+
+    def __init__(self, log_path: str, region_name: str, town_name: str, village_name: str):
+        self.__file = path.join(log_path, "journal", f"{region_name}-{town_name}-{village_name}.jsonl")
+        self.__f = None
+        self.__lock = threading.Lock()
+
+    def records(self) -> List[dict]:
+        """
+        读取日志中的所有记录，忽略中断时写了一半的最后一行
+        """
+        records = []
+        try:
+            with open(self.file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        break
+        except OSError:
+            pass
+        return records
+
+    def state(self) -> str:
+        """
+        :return: "none" -> 没有日志 ; "done" -> 已处理完成 ; "interrupted" -> 处理中断
+        """
+        records = self.records()
+        if not records:
+            return "none"
+        if records[-1]["event"] == "end":
+            return "done"
+        return "interrupted"
+
+    def begin(self) -> None:
+        """
+        开始处理该村，清空旧的日志
+        """
+        if not path.exists(path.dirname(self.file)):
+            os.makedirs(path.dirname(self.file), exist_ok=True)
+        self.__f = open(self.file, "w", encoding="utf-8")
+        self.record("begin", sync=True)
+
+    def record(self, event: str, sync: bool = False, **fields) -> None:
+        """
+        追加一条记录
+        :param event: 记录类型
+        :param sync: 是否立即落盘；文件移动只需写入操作系统缓冲区，进程崩溃时不会丢失
+        :param fields: 记录内容
+        """
+        if self.__f is None:
+            return
+        line = json.dumps(dict(event=event, **fields), ensure_ascii=False) + "\n"
+        with self.__lock:
+            self.__f.write(line)
+            self.__f.flush()
+            if sync:
+                os.fsync(self.__f.fileno())
+
+    def end(self, states: Dict[str, bool]) -> None:
+        """
+        该村处理完成
+        :param states: 最终的处理状态
+        """
+        self.record("end", sync=True, states=states)
+        self.close()
+
+    def close(self) -> None:
+        if self.__f is not None:
+            self.__f.close()
+            self.__f = None
+
+    def rollback(self, generated: Iterable[str]) -> None:
+        """
+        回滚处理到一半的村：删除处理过程中生成的文件，再按相反顺序撤销所有移动和转换，
+        转换过的文件以新格式的内容放回原位置（扫描时会按内容纠正后缀），最后删除从压缩包解压的文件
+        :param generated: 可能由处理过程生成的文件（绝对路径），其中不是由移动得到的文件将被删除
+        """
+        records = self.records()
+        moves = [record for record in records if record["event"] in ("move", "convert")]
+        moved = {record["dst"] for record in moves}
+        for file in generated:
+            if file not in moved and path.isfile(file):
+                os.remove(file)
+        for record in reversed(moves):
+            src, dst = record["src"], record["dst"]
+            if path.exists(dst) and not path.exists(src):
+                if not path.exists(path.dirname(src)):
+                    os.makedirs(path.dirname(src))
+                move.move(dst, src)
+        for record in records:
+            # 从压缩包解压的文件经过上面的撤销后回到了解压位置，删除后压缩包仍在，重新处理时再次解压
+            if record["event"] == "extract" and path.isfile(record["dst"]):
+                os.remove(record["dst"])
+
+    @property
+    def file(self):
+        return self.__file
+
+
+_journal: Union[VillageJournal, None] = None
+
+
+def get_journal() -> Union[VillageJournal, None]:
+    """
+    当前进程正在记录的日志（同一进程中同时只处理一个村）
+    """
+    return _journal
+
+
+def set_journal(journal: Union[VillageJournal, None]) -> None:
+    global _journal
+    _journal = journal
+
+
+def note(event: str, **fields) -> None:
+    """
+    向当前日志追加一条记录，没有日志时忽略
+    """
+    if _journal is not None:
+        _journal.record(event, **fields)
+
+
+def rename(src: str, dst: str) -> None:
+    """
+    记录后再移动文件
+    :param src: 源文件名（绝对路径）
+    :param dst: 目的文件名（绝对路径）
+    """
+    note("move", src=src, dst=dst)
+    move.move(src, dst)
+
+
+def rename_batch(pairs: List[Tuple[str, str]]) -> None:
+    """
+    全部记录后再批量移动文件（见 move.move_batch），有文件移动失败时抛出第一个异常
+    :param pairs: (源文件名, 目的文件名) 的列表（绝对路径）
+    """
+    for src, dst in pairs:
+        note("move", src=src, dst=dst)
+    for result in move.move_batch(pairs).values():
+        if isinstance(result, Exception):
+            raise result
@@ -0,0 +1,138 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import json
+import os
+import os.path as path
+from typing import Dict, Iterable, Union
+
+from . import utils
+from .convert import file_digest
+
+# 处理规则或输出格式发生变化时需修改，旧版本写下的清单将自动失效
+TOOL_VERSION = "2.0"
+
+
+def relative_name(file: str, root_path: str) -> str:
+    """
+    文件相对于 root_path 的名称，统一使用 '/' 分隔
+    """
+    return path.relpath(file, root_path).replace(os.sep, '/')
+
+
+def input_mtime(record: utils.FileRecord) -> Union[int, None]:
+    """
+    写入清单时仍在原位置的输入文件的修改时间（纳秒），之后大小与修改时间均未变化时无需再计算摘要
+    :param record: 扫描得到的文件记录
+    :return: 修改时间，文件已不在原位置或大小不同时为None
+    """
+    try:
+        stat = os.stat(record.source)
+    except OSError:
+        return None
+    return stat.st_mtime_ns if stat.st_size == record.size else None
+
+
+class VillageManifest(object):
+    """
+    村处理结果清单，位于日志目录下：记录输入文件、输出文件的大小与摘要、states 以及工具版本，
+    再次运行时若村目录与清单一致，则无需重新处理
+    """
+
+    def __init__(self, log_path: str, region_name: str, town_name: str, village_name: str):
+        self.__file = path.join(log_path, "manifest", f"{region_name}-{town_name}-{village_name}.json")
+
+    def load(self) -> Union[dict, None]:
+        """
+        :return: 清单内容，不存在或无法读取时为None
+        """
+        try:
+            with open(self.file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, village_path: str, states: Dict[str, bool], inputs: Iterable[utils.FileRecord], substances: utils.Substances,
+              options: dict = None) -> None:
+        """
+        处理完成后写入清单
+        :param village_path: 村目录（绝对路径）
+        :param states: 处理状态
+        :param inputs: 扫描得到的文件记录
+        :param substances: 处理后的文件索引
+        :param options: 影响处理结果的运行选项（如照片去重、照片缩小的设置）
+        """
+        outputs = {
+            relative_name(entry.path, village_path): {"size": entry.size, "mtime": entry.mtime, "sha1": file_digest(entry.path)}
+            for entry in utils.walk_files(village_path)
+        }
+        inputs = [
+            {"source": relative_name(record.source, village_path), "kind": record.kind, "size": record.size, "sha1": record.digest,
+             "mtime_ns": input_mtime(record)}
+            for record in inputs
+        ]
+        manifest = {
+            "version": TOOL_VERSION,
+            "options": options or {},
+            "states": states,
+            "inputs": inputs,
+            "outputs": outputs,
+            "substances": {
+                kind: [relative_name(file, village_path) for file in files if path.exists(file)]
+                for kind, files in substances.items() if kind != "cache"
+            },
+        }
+        if not path.exists(path.dirname(self.file)):
+            os.makedirs(path.dirname(self.file), exist_ok=True)
+        # 先写入临时文件再替换，中途退出不会留下不完整的清单
+        with open(self.file + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(self.file + ".tmp", self.file)
+
+    def remove(self) -> None:
+        if path.exists(self.file):
+            os.remove(self.file)
+
+    def match(self, village_path: str, state_keys: Iterable[str], options: dict = None) -> Union[dict, None]:
+        """
+        检查村目录是否与清单一致：运行选项相同，文件集合、大小相同，修改时间不同的文件摘要也相同，
+        仍在原位置且大小或修改时间有变化的输入文件摘要与扫描时相同
+        :param village_path: 村目录（绝对路径）
+        :param state_keys: 当前版本 states 的所有键
+        :param options: 本次的运行选项，与写入清单时不同则需要重新处理
+        :return: 一致时为清单内容，否则为None
+        """
+        manifest = self.load()
+        if manifest is None or manifest.get("version") != TOOL_VERSION or not path.isdir(village_path):
+            return None
+        if manifest.get("options") != (options or {}):
+            return None
+        if set(manifest["states"]) != set(state_keys) or not all(manifest["states"].values()):
+            return None
+        outputs = manifest["outputs"]
+        found = 0
+        for entry in utils.walk_files(village_path):
+            output = outputs.get(relative_name(entry.path, village_path))
+            if output is None or output["size"] != entry.size:
+                return None
+            if output["mtime"] != entry.mtime and output["sha1"] != file_digest(entry.path):
+                return None
+            found += 1
+        if found != len(outputs):
+            return None
+        for record in manifest["inputs"]:
+            # 仍在原位置的输入文件，大小和修改时间都与写入清单时相同则内容未变，否则按摘要确认
+            file = path.join(village_path, *record["source"].split('/'))
+            if record.get("sha1") is None or not path.isfile(file):
+                continue
+            stat = os.stat(file)
+            if stat.st_size != record["size"] or stat.st_mtime_ns == record.get("mtime_ns"):
+                continue
+            if file_digest(file, cached=False) != record["sha1"]:
+                return None
+        return manifest
+
+    @property
+    def file(self):
+        return self.__file
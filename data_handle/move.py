@@ -0,0 +1,131 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import errno
+import filecmp
+import os
+import os.path as path
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple, Union
+
+# 批量移动时的线程数：移动主要等待磁盘，线程数过多反而会增加寻道
+MOVE_WORKERS = 4
+# 跨设备复制时每次交给内核复制的字节数
+COPY_CHUNK = 64 * 1024 * 1024
+
+
+def kernel_copy(fsrc, fdst, size: int) -> None:
+    """
+    在内核中复制文件内容，不经过用户空间缓冲区：优先使用 copy_file_range，其次 sendfile，
+    均不可用时（如 Windows、较旧的内核）使用普通复制
+    :param fsrc: 以二进制读打开的源文件
+    :param fdst: 以二进制写打开的目的文件
+    :param size: 源文件字节数
+    """
+    offset = 0
+    for name in ("copy_file_range", "sendfile"):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        try:
+            while offset < size:
+                if name == "copy_file_range":
+                    copied = func(fsrc.fileno(), fdst.fileno(), min(COPY_CHUNK, size - offset), offset, offset)
+                else:
+                    os.lseek(fdst.fileno(), offset, os.SEEK_SET)
+                    copied = func(fdst.fileno(), fsrc.fileno(), offset, min(COPY_CHUNK, size - offset))
+                if copied == 0:
+                    break
+                offset += copied
+            if offset >= size:
+                return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP):
+                raise
+    # 从已复制的位置继续
+    fsrc.seek(offset)
+    fdst.seek(offset)
+    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+
+
+def copy_file(src: str, dst: str) -> None:
+    """
+    跨设备复制文件：先复制到目的目录下的临时文件，校验内容一致后再替换为目的文件，
+    中途失败不会留下不完整的目的文件
+    :param src: 源文件名（绝对路径）
+    :param dst: 目的文件名（绝对路径）
+    """
+    tmp_file = dst + ".moving"
+    try:
+        with open(src, "rb") as fsrc, open(tmp_file, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            kernel_copy(fsrc, fdst, size)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        shutil.copystat(src, tmp_file)
+        if path.getsize(tmp_file) != size or not filecmp.cmp(src, tmp_file, shallow=False):
+            raise OSError(errno.EIO, "copied file differs from source", src)
+        os.replace(tmp_file, dst)
+    except BaseException:
+        if path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def move(src: str, dst: str) -> None:
+    """
+    移动文件或文件夹：同一设备上直接重命名，跨设备时复制并校验后删除源文件
+    :param src: 源文件名（绝对路径）
+    :param dst: 目的文件名（绝对路径）
+    """
+    try:
+        os.rename(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    if path.isdir(src):
+        if not path.exists(dst):
+            os.mkdir(dst)
+        for name in os.listdir(src):
+            move(path.join(src, name), path.join(dst, name))
+        os.rmdir(src)
+    else:
+        copy_file(src, dst)
+        os.remove(src)
+
+
+def make_dirs(files: Iterable[str]) -> None:
+    """
+    一次性建立所有目的文件所在的文件夹，每个文件夹只检查一次
+    :param files: 目的文件名（绝对路径）
+    """
+    for dir_path in sorted({path.dirname(file) for file in files}):
+        if not path.isdir(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+
+
+def move_batch(pairs: List[Tuple[str, str]], workers: int = MOVE_WORKERS) -> Dict[str, Union[str, Exception]]:
+    """
+    批量移动文件：先建立所有目的文件夹，再由有界线程池并行移动
+    :param pairs: (源文件名, 目的文件名) 的列表，目的文件名不能重复
+    :param workers: 线程数，小于等于 1 时逐个移动
+    :return: 源文件名 -> 目的文件名，移动失败时为对应的异常
+    """
+    make_dirs(dst for _, dst in pairs)
+
+    def run(pair: Tuple[str, str]) -> Union[str, Exception]:
+        try:
+            move(*pair)
+        except Exception as e:
+            return e
+        return pair[1]
+
+    if workers <= 1 or len(pairs) <= 1:
+        results = [run(pair) for pair in pairs]
+    else:
+        with ThreadPoolExecutor(max_workers=min(workers, len(pairs))) as executor:
+            results = list(executor.map(run, pairs))
+    return {src: result for (src, _), result in zip(pairs, results)}
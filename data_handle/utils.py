@@ -2,17 +2,31 @@
     Author:Jack Xu
     Gmail:jack2919048985@gmail.com
 """
+import hashlib
+import io
+import mmap
 import os
 import os.path as path
+import queue
 import re
-import time
+import shutil
+import struct
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from copy import deepcopy
-from typing import List, Dict, Union
+from functools import lru_cache
+from xml.etree import ElementTree
+from typing import Callable, Iterable, List, Dict, Tuple, Union
 
 import docx as dx
 import pandas as pd
-import win32com.client as win32
 import xlsxwriter
+from lxml import etree
+
+from . import convert
+from . import journal
+from . import move
 
 
 def doc_to_docx(file: str) -> str:
@@ -21,16 +35,7 @@ def doc_to_docx(file: str) -> str:
     :param file: 文件名（绝对路径）
     :return: 转换后的文件名（绝对路径）
     """
-    word = win32.Dispatch("Word.Application")
-    doc = word.Documents.Open(file)
-    file_new = file.replace('.doc', '.docx')
-    if not path.exists(file_new):
-        doc.SaveAs(file_new, 12)
-    doc.Close()
-    word.Quit()
-    time.sleep(1)
-    os.remove(file)
-    return file_new
+    return convert.get_pool().convert(file)
 
 
 def wps_to_docx(file: str) -> str:
@@ -39,16 +44,7 @@ def wps_to_docx(file: str) -> str:
     :param file: 文件名（绝对路径）
     :return: 转换后的文件名（绝对路径）
     """
-    word = win32.Dispatch("Word.Application")
-    doc = word.Documents.Open(file)
-    file_new = file.replace('.wps', '.docx')
-    if not path.exists(file_new):
-        doc.SaveAs(file_new, 12)
-    doc.Close()
-    word.Quit()
-    time.sleep(1)
-    os.remove(file)
-    return file_new
+    return convert.get_pool().convert(file)
 
 
 def xls_to_xlsx(file: str) -> str:
@@ -57,17 +53,444 @@ def xls_to_xlsx(file: str) -> str:
     :param file: 文件名（绝对路径）
     :return: 转换后的文件名（绝对路径）
     """
-    excel = win32.gencache.EnsureDispatch('Excel.Application')
-    wb = excel.Workbooks.Open(file)
-    file_new = file.replace('.xls', '.xlsx')
-    if not path.exists(file_new):
-        wb.SaveAs(file_new, FileFormat=51)
-    wb.Close()
-    excel.Application.Quit()
-    os.remove(file)
+    return convert.get_pool().convert(file)
+
+
+OLE2_MAGIC = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+OLE2_FREE_SECTOR = 0xFFFFFFFA  # 大于等于该值的扇区号均不指向数据扇区
+
+# 文件内容格式 -> 可以接受的后缀（第一个为规范后缀）
+SNIFF_SUFFIXES = {
+    "doc": ('.doc', '.wps'),
+    "xls": ('.xls',),
+    "docx": ('.docx',),
+    "xlsx": ('.xlsx',),
+    "zip": ('.zip',),
+    "jpg": ('.jpg',),
+    "png": ('.png',),
+}
+
+
+def ole2_stream_names(f, max_sectors: int = 64) -> List[str]:
+    """
+    读取 OLE2 复合文档（.doc/.xls/.wps）目录中的流名称
+    :param f: 以二进制方式打开的文件对象
+    :param max_sectors: 最多读取的目录扇区数
+    :return: 流名称列表
+    """
+    f.seek(0)
+    header = f.read(512)
+    sector_size = 1 << struct.unpack_from('<H', header, 0x1E)[0]
+    dir_sector = struct.unpack_from('<I', header, 0x30)[0]
+    # 头部的 DIFAT 中最多记录 109 个 FAT 扇区，足以覆盖目录所在的扇区
+    fat_sectors = [s for s in struct.unpack_from('<109I', header, 0x4C) if s < OLE2_FREE_SECTOR]
+    fat: List[int] = []
+    for fat_sector in fat_sectors:
+        f.seek((fat_sector + 1) * sector_size)
+        data = f.read(sector_size)
+        fat.extend(struct.unpack('<%dI' % (len(data) // 4), data[:len(data) // 4 * 4]))
+    names = []
+    for _ in range(max_sectors):
+        if dir_sector >= OLE2_FREE_SECTOR:
+            break
+        f.seek((dir_sector + 1) * sector_size)
+        data = f.read(sector_size)
+        for offset in range(0, len(data) - 127, 128):
+            name_length = struct.unpack_from('<H', data, offset + 0x40)[0]
+            if 2 <= name_length <= 64:
+                names.append(data[offset:offset + name_length - 2].decode('utf-16-le', 'ignore'))
+        dir_sector = fat[dir_sector] if dir_sector < len(fat) else OLE2_FREE_SECTOR
+    return names
+
+
+def sniff_head(head: bytes) -> Union[str, None]:
+    """
+    只根据文件头判断文件的格式大类
+    :param head: 文件开头的若干字节（至少 512 字节，文件较短时为全部内容）
+    :return: "ole2"/"zip"/"jpg"/"png"/"rtf"/"html"，无法判断时为None
+    """
+    if head.startswith(OLE2_MAGIC):
+        return "ole2"
+    if head.startswith(b'PK\x03\x04'):
+        return "zip"
+    if head.startswith(b'\xff\xd8\xff'):
+        return "jpg"
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return "png"
+    if head.startswith(b'{\\rtf'):
+        return "rtf"
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n').lower()
+    if text.startswith((b'<!doctype html', b'<html', b'<table', b'mime-version')):
+        return "html"
+    return None
+
+
+def sniff_format(file: str) -> Union[str, None]:
+    """
+    根据文件头和 zip 中央目录判断文件的真实格式，与后缀无关
+    :param file: 文件名（绝对路径）
+    :return: "doc"/"xls"/"docx"/"xlsx"/"zip"/"jpg"/"png"/"html"/"rtf"，无法判断时为None
+    """
+    try:
+        with open(file, 'rb') as f:
+            head = sniff_head(f.read(512))
+            if head == "ole2":
+                names = ole2_stream_names(f)
+                if "WordDocument" in names:
+                    return "doc"
+                if "Workbook" in names or "Book" in names:
+                    return "xls"
+                return None
+            if head == "zip":
+                # 只读取中央目录和关系、类型两个小文件，不解压其余成员
+                with zipfile.ZipFile(f) as zip_file:
+                    return ooxml_format(zip_file) or "zip"
+            return head
+    except (OSError, struct.error, zipfile.BadZipFile):
+        return None
+
+
+def ooxml_format(zip_file: zipfile.ZipFile) -> Union[str, None]:
+    """
+    按包关系找到主文档部分，再按其内容类型判断 Office Open XML 文档的格式（主文档部分不一定叫 document.xml）
+    :param zip_file: 已打开的压缩包
+    :return: "docx"/"xlsx"，不是 Word/Excel 文档时为None
+    """
+    names = set(zip_file.namelist())
+    if "_rels/.rels" not in names:
+        return None
+    try:
+        main_part = docx_main_part(zip_file)
+        content_types = ElementTree.fromstring(zip_file.read("[Content_Types].xml"))
+    except (KeyError, ElementTree.ParseError):
+        return None
+    if main_part not in names:
+        return None
+    content_type = ""
+    for item in content_types:
+        if xml_tag(item) == "Override" and (item.get("PartName") or "").lstrip('/') == main_part:
+            content_type = item.get("ContentType") or ""
+            break
+    else:
+        extension = path.splitext(main_part)[1].lstrip('.')
+        for item in content_types:
+            if xml_tag(item) == "Default" and (item.get("Extension") or "").lower() == extension.lower():
+                content_type = item.get("ContentType") or ""
+    if "wordprocessingml" in content_type:
+        return "docx"
+    if "spreadsheetml" in content_type:
+        return "xlsx"
+    # 缺少内容类型时按主文档部分所在的文件夹判断
+    if main_part.startswith("word/"):
+        return "docx"
+    if main_part.startswith("xl/"):
+        return "xlsx"
+    return None
+
+
+def unique_name(file: str) -> str:
+    """
+    目标文件已存在时，在文件名前加上序号
+    :param file: 目标文件名（绝对路径）
+    :return: 不存在的文件名（绝对路径）
+    """
+    dir_name, file_name = path.split(file)
+    n = 1
+    while path.exists(file):
+        n += 1
+        file = path.join(dir_name, f"{n:02d}-{file_name}")
+    return file
+
+
+# zip 中需要提取的成员：后缀 -> 成员文件头可以是的格式（与后缀不符的由 fix_suffix 纠正）
+ZIP_MEMBER_HEADS = {
+    '.doc': ("ole2", "zip", "html", "rtf"),
+    '.docx': ("ole2", "zip", "html", "rtf"),
+    '.wps': ("ole2", "zip", "html", "rtf"),
+    '.xls': ("ole2", "zip", "html"),
+    '.xlsx': ("ole2", "zip", "html"),
+    '.jpg': ("jpg", "png"),
+    '.jpeg': ("jpg", "png"),
+    '.png': ("jpg", "png"),
+    '.zip': ("zip",),
+}
+ZIP_UTF8_FLAG = 0x800  # 通用标志位第 11 位：成员名以 UTF-8 编码
+
+
+def zip_member_name(info: zipfile.ZipInfo) -> str:
+    """
+    成员名的正确解码：未设置 UTF-8 标志时 zipfile 按 cp437 解码，而国内常用的压缩软件实际以 GBK 编码
+    :param info: zip 成员
+    :return: 成员名
+    """
+    if info.flag_bits & ZIP_UTF8_FLAG:
+        return info.filename
+    try:
+        return info.filename.encode('cp437').decode('gbk')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+
+def safe_member_name(name: str) -> str:
+    """
+    去掉成员名中的盘符以及 Windows 文件名中不允许的字符，保证解压后的文件一定位于目的文件夹中
+    :param name: 去掉文件夹后的成员名
+    :return: 可以直接作为文件名的成员名，无法使用时为空字符串
+    """
+    name = re.sub(r'^[A-Za-z]:', '', name)
+    name = re.sub(r'[<>:"/\\|?*\x00-\x1f]', '_', name)
+    return name.rstrip(' .')
+
+
+def zip_plan(file: str) -> List[Tuple[zipfile.ZipInfo, str]]:
+    """
+    只读取中央目录与各成员的文件头，找出需要提取的成员（不解压其余内容）
+    :param file: zip 文件名（绝对路径）
+    :return: (成员, 去掉文件夹后的成员名) 的列表
+    """
+    plan = []
+    try:
+        with zipfile.ZipFile(file) as zip_file:
+            for info in zip_file.infolist():
+                if info.is_dir():
+                    continue
+                member_name = zip_member_name(info).replace('\\', '/')
+                name = safe_member_name(member_name.split('/')[-1])
+                if member_name.startswith('__MACOSX/') or not name or name.startswith(('~$', '.')):
+                    continue
+                heads = ZIP_MEMBER_HEADS.get(path.splitext(name)[1].lower())
+                if heads is None:
+                    continue
+                try:
+                    with zip_file.open(info) as member:
+                        head = member.read(512)
+                except (RuntimeError, NotImplementedError, zipfile.BadZipFile, OSError):
+                    # 加密或不支持的压缩方式
+                    continue
+                if sniff_head(head) in heads:
+                    plan.append((info, name))
+    except (OSError, zipfile.BadZipFile):
+        return []
+    return plan
+
+
+def extract_zip(file: str, dst_path: str) -> List[str]:
+    """
+    将 zip 中需要的成员逐个以流的方式解压到 dst_path，不保留压缩包中的文件夹，重名时在文件名前加上序号
+    :param file: zip 文件名（绝对路径）
+    :param dst_path: 目的文件夹（绝对路径）
+    :return: 解压得到的文件名（绝对路径）列表
+    """
+    extracted = []
+    plan = zip_plan(file)
+    if not plan:
+        return extracted
+    with zipfile.ZipFile(file) as zip_file:
+        for info, name in plan:
+            file_new = unique_name(path.join(dst_path, name))
+            journal.note("extract", src=file, member=info.filename, dst=file_new)
+            try:
+                with zip_file.open(info) as member, open(file_new, 'wb') as f:
+                    shutil.copyfileobj(member, f, 1 << 20)
+            except (OSError, zipfile.BadZipFile):
+                # 成员损坏（如 CRC 校验失败）
+                if path.exists(file_new):
+                    os.remove(file_new)
+                continue
+            extracted.append(file_new)
+    return extracted
+
+
+def sniff_suffix(file: str) -> Union[str, None]:
+    """
+    根据文件的真实格式给出应有的后缀
+    :param file: 文件名（绝对路径）
+    :return: 后缀与真实格式不符时为应有的后缀，否则为None
+    """
+    fmt = sniff_format(file)
+    suffix = path.splitext(file)[1]
+    if fmt in ("html", "rtf"):
+        # 网页/RTF 格式仍需转换，按原后缀交给 Word 或 Excel
+        if suffix.lower() in ('.xls', '.xlsx'):
+            fmt = "xls"
+        elif suffix.lower() in ('.doc', '.docx', '.wps'):
+            fmt = "doc"
+        else:
+            return None
+    if fmt == "zip" and suffix.lower() not in ('.doc', '.docx', '.wps', '.xls', '.xlsx'):
+        # 其他以 zip 为容器的格式（如 .pptx、.odt、.epub）保持原后缀，不当作压缩包解压
+        return None
+    if fmt is None or suffix in SNIFF_SUFFIXES[fmt]:
+        return None
+    return SNIFF_SUFFIXES[fmt][0]
+
+
+def fix_suffix(file: str) -> str:
+    """
+    若文件后缀与其真实格式不符，则将其重命名为正确的后缀，
+    从而使后续按后缀分类时不会进行不必要的转换或误判
+    :param file: 文件名（绝对路径）
+    :return: 重命名后的文件名（绝对路径）
+    """
+    suffix = sniff_suffix(file)
+    if suffix is None:
+        return file
+    file_new = path.splitext(file)[0] + suffix
+    if not (path.exists(file_new) and path.samefile(file_new, file)):
+        # 只改变后缀大小写时，在不区分大小写的文件系统上目标即为文件本身，不需要加序号
+        file_new = unique_name(file_new)
+    journal.rename(file, file_new)
     return file_new
 
 
+def xml_tag(elem: ElementTree.Element) -> str:
+    """
+    去除命名空间后的 xml 标签名
+    :param elem: xml 元素
+    :return: 标签名
+    """
+    return elem.tag.rsplit('}', 1)[-1] if isinstance(elem.tag, str) else ""
+
+
+def xml_attr(elem: ElementTree.Element, name: str) -> Union[str, None]:
+    """
+    忽略命名空间读取 xml 属性值
+    :param elem: xml 元素
+    :param name: 属性名
+    :return: 属性值，不存在时返回None
+    """
+    for key, value in elem.attrib.items():
+        if key.rsplit('}', 1)[-1] == name:
+            return value
+    return None
+
+
+def xml_child(elem: ElementTree.Element, tag: str) -> Union[ElementTree.Element, None]:
+    """
+    忽略命名空间查找第一个直接子元素
+    :param elem: xml 元素
+    :param tag: 子元素标签名
+    :return: 子元素，不存在时返回None
+    """
+    for child in elem:
+        if xml_tag(child) == tag:
+            return child
+    return None
+
+
+def docx_main_part(docx: zipfile.ZipFile) -> str:
+    """
+    查找 docx 压缩包中正文部分的 xml 文件名
+    :param docx: 已打开的 docx 压缩包
+    :return: 正文部分在压缩包中的文件名
+    """
+    rels = ElementTree.fromstring(docx.read("_rels/.rels"))
+    for rel in rels:
+        if (rel.get("Type") or "").endswith("/officeDocument"):
+            return rel.get("Target").lstrip('/')
+    return "word/document.xml"
+
+
+def docx_cell_text(tc: ElementTree.Element) -> str:
+    """
+    按 python-docx 的规则读取表格单元格 (w:tc) 的文本
+    :param tc: 单元格元素
+    :return: 单元格文本，遇到各版本 python-docx 处理不一致的元素时抛出 ValueError
+    """
+    paragraphs = []
+    for p in tc:
+        if xml_tag(p) != "p":
+            continue
+        text = ""
+        for r in p:
+            if xml_tag(r) == "hyperlink":
+                raise ValueError("hyperlink in table cell")
+            if xml_tag(r) != "r":
+                continue
+            for e in r:
+                tag = xml_tag(e)
+                if tag == "t":
+                    text += e.text or ""
+                elif tag == "tab":
+                    text += "\t"
+                elif tag == "cr" or (tag == "br" and xml_attr(e, "type") in (None, "textWrapping")):
+                    text += "\n"
+                elif tag in ("br", "noBreakHyphen", "ptab"):
+                    raise ValueError(f"{tag} in table cell")
+        paragraphs.append(text)
+    return "\n".join(paragraphs)
+
+
+def docx_table_cells(tbl: ElementTree.Element) -> Tuple[List[ElementTree.Element], int]:
+    """
+    按 python-docx 中 Table._cells 的规则展开表格 (w:tbl) 的单元格，合并单元格重复出现
+    :param tbl: 表格元素
+    :return: (按行展开的单元格元素列表, 列数)
+    """
+    grid = xml_child(tbl, "tblGrid")
+    if grid is None:
+        raise ValueError("table without tblGrid")
+    col_count = len([e for e in grid if xml_tag(e) == "gridCol"])
+    cells = []
+    for tr in tbl:
+        if xml_tag(tr) != "tr":
+            continue
+        for tc in tr:
+            if xml_tag(tc) != "tc":
+                continue
+            tc_pr = xml_child(tc, "tcPr")
+            grid_span = xml_child(tc_pr, "gridSpan") if tc_pr is not None else None
+            v_merge = xml_child(tc_pr, "vMerge") if tc_pr is not None else None
+            span = int(xml_attr(grid_span, "val")) if grid_span is not None else 1
+            merged = v_merge is not None and xml_attr(v_merge, "val") in (None, "continue")
+            for i in range(span):
+                if merged:
+                    cells.append(cells[-col_count])
+                elif i > 0:
+                    cells.append(cells[-1])
+                else:
+                    cells.append(tc)
+    return cells, col_count
+
+
+def docx_table_probe(file: str) -> Union[int, None]:
+    """
+    流式读取 docx 正文，只统计正文表格数量并读取第一个表格的前两个单元格，判断规则与 docx01_or_docx02 一致
+    :param file: 文件名（绝对路径）
+    :return: 1 -> 附件1 ; 2 -> 附件二 ; 3 -> 异常 ; None -> 均不符合
+    """
+    with zipfile.ZipFile(file) as docx:
+        with docx.open(docx_main_part(docx)) as document:
+            stack, tables, decision = [], 0, 3
+            for event, elem in ElementTree.iterparse(document, events=("start", "end")):
+                if event == "start":
+                    stack.append(xml_tag(elem))
+                    continue
+                tag = stack.pop()
+                if stack[-1:] != ["body"]:
+                    continue
+                if tag == "tbl":
+                    tables += 1
+                    if tables == 1:
+                        try:
+                            cells, col_count = docx_table_cells(elem)
+                            if docx_cell_text(cells[0]) == "编号" or docx_cell_text(cells[col_count]) == "建筑年代":
+                                return 1
+                            elif docx_cell_text(cells[0]) == "自然村地址" or docx_cell_text(cells[col_count]) == "房屋总数（栋）":
+                                decision = 2
+                            else:
+                                decision = None
+                        except IndexError:
+                            # python-docx 读取单元格时同样会抛出 IndexError
+                            decision = 3
+                    elif tables == 3:
+                        # 三个及以上表格一律视为附件1
+                        return 1
+                # 释放已读取的正文元素
+                elem.clear()
+            return decision
+
+
 def docx01_or_docx02(file: str) -> int:
     """
     判断.docx文档是附件一还是附件二
@@ -79,6 +502,11 @@ def docx01_or_docx02(file: str) -> int:
             file = doc_to_docx(file)
         elif file.endswith('.wps'):
             file = wps_to_docx(file)
+        try:
+            return docx_table_probe(file)
+        except Exception:
+            # 流式判断失败时回退到 python-docx 完整解析
+            pass
         docx = dx.Document(file)
         if len(docx.tables) == 0:
             return 3
@@ -99,6 +527,12 @@ def xlsx01_or_xlsx02(file: str) -> bool:
     :param file: 文件名（绝对路径）
     :return: True -> 单体抗震调查表 ; False -> 整体抗震统计表
     """
+    try:
+        decision = xlsx_column_probe(file)
+    except Exception:
+        decision = None
+    if decision is not None:
+        return decision
     excel_df = pd.read_excel(file)
     if excel_df.shape[1] >= 20:
         return True
@@ -106,360 +540,440 @@ def xlsx01_or_xlsx02(file: str) -> bool:
         return False
 
 
-def get_excel01_dict(location: Dict[str, str], name: str, phone: str, table) -> Dict[str, str]:
+def column_index(column: str) -> int:
     """
-    从附件1中获取信息
-    :param location: 包含户所在的区名、镇名、村名的字典
-    :param name: 该户姓名
-    :param phone: 该户联系方式
-    :param table: 从该户 word01 文档中解析得到的table对象
-    :return: 包含 word01 文档中重要信息的字典
+    将表格列名转换为列序号
+    :param column: 列名，如 "A"、"AQ"
+    :return: 从 1 开始的列序号
     """
-    info_dic = dict()
-    info_dic["编号"] = table.cell(0, 2).text
-
-    text = table.cell(28, 5).text
-    text = re.findall(r'\d{1,4}', text)
-    info_dic["北纬"] = text[0] + '°' + text[1] + '′' if len(text) == 4 else ""
-    info_dic["东经"] = text[2] + '°' + text[3] + '′' if len(text) == 4 else ""
-
-    info_dic["区"] = location["region_name"]
-    info_dic["乡镇"] = location["town_name"]
-    info_dic["村庄"] = location["village_name"]
-    info_dic["户主"] = name
-    info_dic["户主联系方式"] = phone
-    info_dic["建筑年代"] = table.cell(1, 2).text
-    info_dic["层数"] = table.cell(1, 8).text
-    info_dic["结构类型"] = table.cell(1, 18).text
-    info_dic["建筑高度"] = table.cell(2, 2).text
-    info_dic["建筑宽度"] = table.cell(2, 8).text
-    info_dic["建筑长度"] = table.cell(2, 18).text
-    info_dic["常住人口"] = table.cell(3, 18).text
-
-    text = table.cell(4, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{2,4} {0,2}√", text)
-        info_dic["平面"] = text[0].replace('√', '') if text else ""
-        info_dic["立面"] = text[1].replace('√', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text01_ls, text02_ls = re.findall(r'平面:不?规则', text), re.findall(r'立面:不?规则', text)
-        info_dic["平面"] = text01_ls[0].split(':')[-1] if text01_ls else ''
-        info_dic["立面"] = text02_ls[0].split(':')[-1] if text02_ls else ''
+    index = 0
+    for char in column.upper():
+        index = index * 26 + ord(char) - ord('A') + 1
+    return index
 
-    info_dic["房屋间数"] = table.cell(4, 18).text
 
-    text = table.cell(5, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{2,4} {0,2}√", text)
-        info_dic["场地条件"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'场地条件:[\u4E00-\u9FA5]{2,4}', text)
-        info_dic["场地条件"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(6, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"\d+\.?\d*m {0,2}√", text)
-        info_dic["基坑深度"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'基坑深度[(]m[)]:\d[.]?\d?m', text)
-        info_dic["基坑深度"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(7, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{2,3} {0,2}√", text)
-        info_dic["基坑回填材料"] = text[0].replace('√', '').replace(' ', '') if text else "三合土（石灰+黏土+细砂）"
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'基坑回填材料:.*$', text)
-        info_dic["基坑回填材料"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(8, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{1,3} {0,2}√", text)
-        info_dic["基础材料"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'基础材料:[\u4E00-\u9FA5]{1,3}', text)
-        info_dic["基础材料"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(9, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{1,4} {0,2}√", text)
-        info_dic["基础砌筑砂浆材料"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'基础砌筑砂浆材料:[\u4E00-\u9FA5]{1,4}', text)
-        info_dic["基础砌筑砂浆材料"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(12, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{1,4} {0,2}√", text)
-        info_dic["墙体砌块材料"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'砌块材料:[\u4E00-\u9FA5]{2}', text)
-        info_dic["墙体砌块材料"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(13, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{1,4} {0,2}√", text)
-        info_dic["墙体砂浆材料"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'砂浆材料:[\u4E00-\u9FA5]{1,4}', text)
-        info_dic["墙体砂浆材料"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(14, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"\d{2,4}", text)
-        info_dic["外墙厚度"] = text[0] if text else ""
-        info_dic["内墙厚度"] = text[1] if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text01_ls, text02_ls = re.findall(r'外墙\d{1,2}', text), re.findall(r'内墙(房间隔断墙)\d{1,2}', text)
-        info_dic["外墙厚度"] = text01_ls[0].replace('外墙', '') + 'cm' if text01_ls else ""
-        info_dic["内墙厚度"] = text02_ls[0].replace('内墙(房间隔断墙)', '') + 'cm' if text02_ls else ""
-
-    text = table.cell(15, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5] {0,2}√", text)
-        info_dic["烟道"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'墙体内竖向孔道[(]烟囱道[)]:[有无]', text)
-        info_dic["烟道"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(16, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5] {0,2}√", text)
-        info_dic["女儿墙"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'女儿墙[(]屋顶周围的矮墙[)]:[有无]', text)
-        info_dic["女儿墙"] = text[0].split(':')[-1] if text else ''
-
-    info_dic["上部圈梁"] = "有"  # TODO
-    info_dic["上部圈梁闭合"] = "基本"
-    info_dic["基础圈梁"] = "有"
-    info_dic["基础圈梁闭合"] = "基本"
-
-    text = table.cell(20, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{5} {0,2}√", text)
-        info_dic["构造柱"] = "未设置" if text[0].find("未设") != -1 else "设置"
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        info_dic["构造柱"] = "未设置" if text.find("未设") != -1 else "设置"
-
-    text = table.cell(21, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{1,5}.{5} {0,2}√", text)
-        if text:
-            info_dic["屋盖类别"] = "坡顶房" if text[0].find("坡顶房") != -1 else "平顶房"
-        else:
-            info_dic["屋盖类别"] = ''
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'屋盖类别:[\u4E00-\u9FA5]{2,5}[(][坡平]顶房[)]', text)
-        if text:
-            info_dic["屋盖类别"] = "坡顶房" if text[0].find("坡顶房") != -1 else "平顶房"
-        else:
-            info_dic["屋盖类别"] = ''
+def xlsx_first_sheet(xlsx: zipfile.ZipFile) -> str:
+    """
+    查找 xlsx 压缩包中第一个工作表的 xml 文件名
+    :param xlsx: 已打开的 xlsx 压缩包
+    :return: 第一个工作表在压缩包中的文件名
+    """
+    workbook = ElementTree.fromstring(xlsx.read("xl/workbook.xml"))
+    sheet = next(e for e in workbook.iter() if xml_tag(e) == "sheet")
+    rel_id = xml_attr(sheet, "id")
+    rels = ElementTree.fromstring(xlsx.read("xl/_rels/workbook.xml.rels"))
+    target = next(e.get("Target") for e in rels.iter() if e.get("Id") == rel_id)
+    if "worksheets/" not in target:
+        raise ValueError(f"first sheet is not a worksheet: {target}")
+    return target.lstrip('/') if target.startswith('/') else "xl/" + target
 
-    text = table.cell(22, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{1,3} {0,2}√", text)
-        info_dic["楼板类别"] = text[0].replace('√', '').replace(' ', '') if text else ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'楼板类别:[\u4E00-\u9FA5]{1,3}', text)
-        info_dic["楼板类别"] = text[0].split(':')[-1] if text else ''
-
-    text = table.cell(23, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{3} {0,2}√", text)
-        info_dic["墙体歪闪"] = "无" if text[0].find("无") != -1 else "有"
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'墙体:[\u4E00-\u9FA5]{1,3}', text)
-        if text:
-            info_dic["墙体歪闪"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["墙体歪闪"] = ""
 
-    text = table.cell(23, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]腐蚀、酥碎 {0,2}√", text)
-        if text:
-            info_dic["墙体腐蚀"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["墙体腐蚀"] = ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'墙体:[\u4E00-\u9FA5]{1,3}、?[\u4E00-\u9FA5]{0,2}', text)
-        if text:
-            info_dic["墙体腐蚀"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["墙体腐蚀"] = ""
+def xlsx_column_probe(file: str) -> Union[bool, None]:
+    """
+    只读取 xlsx 第一个工作表的 dimension 与首行，判断列数是否不少于 20，不读取数据行
+    :param file: 文件名（绝对路径）
+    :return: True -> 列数不少于 20 ; False -> 列数少于 20 ; None -> 无法仅凭表头判断
+    """
+    dimension_width, row_width = None, None
+    with zipfile.ZipFile(file) as xlsx:
+        with xlsx.open(xlsx_first_sheet(xlsx)) as sheet:
+            for _, elem in ElementTree.iterparse(sheet, events=("end",)):
+                tag = xml_tag(elem)
+                if tag == "dimension":
+                    refs = re.findall(r'^[A-Z]{1,3}\d+:([A-Z]{1,3})\d+$', elem.get("ref", ""))
+                    dimension_width = column_index(refs[0]) if refs else None
+                elif tag == "row":
+                    # 首行中最后一个非空单元格所在的列
+                    row_width, position = 0, 0
+                    for cell in elem:
+                        if xml_tag(cell) != "c":
+                            continue
+                        ref = re.findall(r'^([A-Z]{1,3})\d+$', cell.get("r", ""))
+                        position = column_index(ref[0]) if ref else position + 1
+                        texts = [e.text for e in cell.iter() if xml_tag(e) in ("v", "t") and e.text]
+                        if texts:
+                            row_width = position
+                    break
+                elif tag == "sheetData":
+                    row_width = 0
+                    break
+    if row_width is not None and row_width >= 20:
+        return True
+    if dimension_width is not None and row_width is not None and row_width <= dimension_width < 20:
+        return False
+    return None
 
-    text = table.cell(24, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{5,7} {0,2}√", text)
-        if text:
-            info_dic["墙体裂缝"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["墙体裂缝"] = ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'墙体:[\u4E00-\u9FA5]{5,7}', text)
-        if text:
-            info_dic["墙体裂缝"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["墙体裂缝"] = ""
 
-    text = table.cell(25, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]{5,7} {0,2}√", text)
-        if text:
-            info_dic["基础沉降"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["基础沉降"] = ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'基础:[\u4E00-\u9FA5]{6}', text)
-        if text:
-            info_dic["基础沉降"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["基础沉降"] = ""
+class TableGrid(object):
+    """
+    表格文本快照：一次性展开 python-docx 表格的全部单元格文本，
+    合并单元格的展开方式与 table.cell(row, col) 一致，避免每次取值都重新构建 table._cells
+    """
+    __slots__ = ("__texts", "__col_count", "__row_count")
 
-    text = table.cell(26, 3).text
-    if text.find('√') != -1:
-        text = re.findall(r"[\u4E00-\u9FA5]变形、腐朽或开裂 {0,2}√", text)
-        if text:
-            info_dic["屋盖情况"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["屋盖情况"] = ""
-    else:
-        text = text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace('（', '(').replace('）', ')').replace('\n', '')
-        text = re.findall(r'楼、屋盖构件:[\u4E00-\u9FA5]{3}、[\u4E00-\u9FA5]{5}', text)
-        if text:
-            info_dic["屋盖情况"] = "无" if text[0].find("无") != -1 else "有"
-        else:
-            info_dic["屋盖情况"] = ""
+    def __init__(self, table):
+        """
+        :param table: python-docx 的 table 对象
+        """
+        texts_dic = {}
+        texts = []
+        for cell in table._cells:
+            # 合并单元格在 table._cells 中是同一个对象，只读取一次文本
+            if id(cell) not in texts_dic:
+                texts_dic[id(cell)] = cell.text
+            texts.append(texts_dic[id(cell)])
+        self.__texts = tuple(texts)
+        self.__col_count = table._column_count
+        self.__row_count = len(table.rows)
+
+    def text(self, row: int, col: int) -> str:
+        """
+        读取单元格文本，等价于 table.cell(row, col).text
+        :param row: 行号
+        :param col: 列号
+        :return: 单元格文本
+        """
+        return self.__texts[row * self.__col_count + col]
+
+    @property
+    def col_count(self):
+        return self.__col_count
+
+    @property
+    def row_count(self):
+        return self.__row_count
+
+    @property
+    def cell_count(self):
+        return len(self.__texts)
 
-    info_dic["填表人"] = table.cell(29, 3).text
-    info_dic["填表人联系方式"] = table.cell(29, 9).text
 
+# 标注项匹配前的单元格文本规范化：去除空格与换行，统一中英文标点
+EXCEL01_NORMALIZE = str.maketrans({' ': None, '：': ':', ';': ':', '；': ':', '（': '(', '）': ')', '\n': None})
+
+
+def pick_checked(index: int = 0, strip: bool = True, default: str = ""):
+    """
+    勾选项取值：取第 index 个被勾选的选项，去除 "√"
+    :param index: 匹配结果序号
+    :param strip: 是否去除空格
+    :param default: 没有匹配结果时的取值
+    """
+    def value(found: List[str]) -> str:
+        if not found:
+            return default
+        text = found[index].replace('√', '')
+        return text.replace(' ', '') if strip else text
+    return value
+
+
+def pick_labelled(found: List[str]) -> str:
+    """
+    标注项取值：取第一个匹配结果中冒号后的内容
+    """
+    return found[0].split(':')[-1] if found else ''
+
+
+def pick_stripped(label: str, unit: str):
+    """
+    标注项取值：去除标注文字并加上单位
+    :param label: 需去除的标注文字
+    :param unit: 单位
+    """
+    def value(found: List[str]) -> str:
+        return found[0].replace(label, '') + unit if found else ""
+    return value
+
+
+def pick_flag(word: str, present: str, absent: str, default: Union[str, None] = ""):
+    """
+    二选一取值：第一个匹配结果中含有 word 时取 present，否则取 absent
+    :param default: 没有匹配结果时的取值，为None时与原表格处理一致直接抛出 IndexError
+    """
+    def value(found: List[str]) -> str:
+        if not found and default is not None:
+            return default
+        return present if found[0].find(word) != -1 else absent
+    return value
+
+
+def pick_degree(index: int):
+    """
+    经纬度取值：由 4 个数字组成 "度°分′"
+    :param index: 度所在的匹配结果序号
+    """
+    def value(found: List[str]) -> str:
+        return found[index] + '°' + found[index + 1] + '′' if len(found) == 4 else ""
+    return value
+
+
+class Excel01Field(object):
+    """
+    单体抗震性能调查表 (excel01) 中一个字段的抽取规则，正则表达式在定义时预编译
+    """
+    __slots__ = ("key", "cell", "checkbox", "checked", "fallback", "labelled", "normalize", "default")
+
+    def __init__(self, key: str, cell: Union[Tuple[int, int], None] = None, checkbox: str = None, checked=None,
+                 fallback: str = None, labelled=None, normalize: bool = True, default: str = ""):
+        """
+        :param key: 字段名
+        :param cell: 字段所在单元格 (行号, 列号)，为None时从 context 中取同名值，没有则取 default
+        :param checkbox: 单元格中含有 "√" 时使用的勾选项正则
+        :param checked: 由勾选项匹配结果得到字段值的函数
+        :param fallback: 单元格中没有 "√" 时使用的标注项正则，为None时以整个单元格文本作为匹配结果
+        :param labelled: 由标注项匹配结果得到字段值的函数，与 fallback 均为None时直接取单元格文本
+        :param normalize: 标注项匹配前是否对单元格文本进行规范化
+        :param default: 非单元格字段的默认值
+        """
+        self.key = key
+        self.cell = cell
+        self.checkbox = re.compile(checkbox) if checkbox is not None else None
+        self.checked = checked
+        self.fallback = re.compile(fallback) if fallback is not None else None
+        self.labelled = labelled
+        self.normalize = normalize
+        self.default = default
+
+    def extract(self, grid: TableGrid, context: Dict[str, str], normalized: Dict[Tuple[int, int], str]) -> str:
+        """
+        抽取字段值
+        :param grid: 该户 word01 表格的 TableGrid 快照
+        :param context: 非表格字段的取值（区名、户主等）
+        :param normalized: 已规范化的单元格文本，同一户的多个字段共用
+        :return: 字段值
+        """
+        if self.cell is None:
+            return context.get(self.key, self.default)
+        text = grid.text(*self.cell)
+        if self.checkbox is not None and text.find('√') != -1:
+            return self.checked(self.checkbox.findall(text))
+        if self.fallback is None and self.labelled is None:
+            return text
+        if self.normalize:
+            if self.cell not in normalized:
+                normalized[self.cell] = text.translate(EXCEL01_NORMALIZE)
+            text = normalized[self.cell]
+        return self.labelled(self.fallback.findall(text) if self.fallback is not None else [text])
+
+
+EXCEL01_SCHEMA = [
+    Excel01Field("编号", (0, 2)),
+    Excel01Field("北纬", (28, 5), fallback=r'\d{1,4}', labelled=pick_degree(0), normalize=False),
+    Excel01Field("东经", (28, 5), fallback=r'\d{1,4}', labelled=pick_degree(2), normalize=False),
+    Excel01Field("区"),
+    Excel01Field("乡镇"),
+    Excel01Field("村庄"),
+    Excel01Field("户主"),
+    Excel01Field("户主联系方式"),
+    Excel01Field("建筑年代", (1, 2)),
+    Excel01Field("层数", (1, 8)),
+    Excel01Field("结构类型", (1, 18)),
+    Excel01Field("建筑高度", (2, 2)),
+    Excel01Field("建筑宽度", (2, 8)),
+    Excel01Field("建筑长度", (2, 18)),
+    Excel01Field("常住人口", (3, 18)),
+    Excel01Field("平面", (4, 3), r"[\u4E00-\u9FA5]{2,4} {0,2}√", pick_checked(0, strip=False), r'平面:不?规则', pick_labelled),
+    Excel01Field("立面", (4, 3), r"[\u4E00-\u9FA5]{2,4} {0,2}√", pick_checked(1, strip=False), r'立面:不?规则', pick_labelled),
+    Excel01Field("房屋间数", (4, 18)),
+    Excel01Field("场地条件", (5, 3), r"[\u4E00-\u9FA5]{2,4} {0,2}√", pick_checked(), r'场地条件:[\u4E00-\u9FA5]{2,4}', pick_labelled),
+    Excel01Field("基坑深度", (6, 3), r"\d+\.?\d*m {0,2}√", pick_checked(), r'基坑深度[(]m[)]:\d[.]?\d?m', pick_labelled),
+    Excel01Field("基坑回填材料", (7, 3), r"[\u4E00-\u9FA5]{2,3} {0,2}√", pick_checked(default="三合土（石灰+黏土+细砂）"),
+                 r'基坑回填材料:.*$', pick_labelled),
+    Excel01Field("基础材料", (8, 3), r"[\u4E00-\u9FA5]{1,3} {0,2}√", pick_checked(), r'基础材料:[\u4E00-\u9FA5]{1,3}', pick_labelled),
+    Excel01Field("基础砌筑砂浆材料", (9, 3), r"[\u4E00-\u9FA5]{1,4} {0,2}√", pick_checked(),
+                 r'基础砌筑砂浆材料:[\u4E00-\u9FA5]{1,4}', pick_labelled),
+    Excel01Field("墙体砌块材料", (12, 3), r"[\u4E00-\u9FA5]{1,4} {0,2}√", pick_checked(), r'砌块材料:[\u4E00-\u9FA5]{2}', pick_labelled),
+    Excel01Field("墙体砂浆材料", (13, 3), r"[\u4E00-\u9FA5]{1,4} {0,2}√", pick_checked(), r'砂浆材料:[\u4E00-\u9FA5]{1,4}', pick_labelled),
+    Excel01Field("外墙厚度", (14, 3), r"\d{2,4}", pick_checked(0, strip=False), r'外墙\d{1,2}', pick_stripped('外墙', 'cm')),
+    Excel01Field("内墙厚度", (14, 3), r"\d{2,4}", pick_checked(1, strip=False), r'内墙(房间隔断墙)\d{1,2}',
+                 pick_stripped('内墙(房间隔断墙)', 'cm')),
+    Excel01Field("烟道", (15, 3), r"[\u4E00-\u9FA5] {0,2}√", pick_checked(), r'墙体内竖向孔道[(]烟囱道[)]:[有无]', pick_labelled),
+    Excel01Field("女儿墙", (16, 3), r"[\u4E00-\u9FA5] {0,2}√", pick_checked(), r'女儿墙[(]屋顶周围的矮墙[)]:[有无]', pick_labelled),
+    Excel01Field("上部圈梁", default="有"),  # TODO
+    Excel01Field("上部圈梁闭合", default="基本"),
+    Excel01Field("基础圈梁", default="有"),
+    Excel01Field("基础圈梁闭合", default="基本"),
+    Excel01Field("构造柱", (20, 3), r"[\u4E00-\u9FA5]{5} {0,2}√", pick_flag("未设", "未设置", "设置", default=None),
+                 None, pick_flag("未设", "未设置", "设置")),
+    Excel01Field("屋盖类别", (21, 3), r"[\u4E00-\u9FA5]{1,5}.{5} {0,2}√", pick_flag("坡顶房", "坡顶房", "平顶房", default=''),
+                 r'屋盖类别:[\u4E00-\u9FA5]{2,5}[(][坡平]顶房[)]', pick_flag("坡顶房", "坡顶房", "平顶房", default='')),
+    Excel01Field("楼板类别", (22, 3), r"[\u4E00-\u9FA5]{1,3} {0,2}√", pick_checked(), r'楼板类别:[\u4E00-\u9FA5]{1,3}', pick_labelled),
+    Excel01Field("墙体歪闪", (23, 3), r"[\u4E00-\u9FA5]{3} {0,2}√", pick_flag("无", "无", "有", default=None),
+                 r'墙体:[\u4E00-\u9FA5]{1,3}', pick_flag("无", "无", "有")),
+    Excel01Field("墙体腐蚀", (23, 3), r"[\u4E00-\u9FA5]腐蚀、酥碎 {0,2}√", pick_flag("无", "无", "有"),
+                 r'墙体:[\u4E00-\u9FA5]{1,3}、?[\u4E00-\u9FA5]{0,2}', pick_flag("无", "无", "有")),
+    Excel01Field("墙体裂缝", (24, 3), r"[\u4E00-\u9FA5]{5,7} {0,2}√", pick_flag("无", "无", "有"),
+                 r'墙体:[\u4E00-\u9FA5]{5,7}', pick_flag("无", "无", "有")),
+    Excel01Field("基础沉降", (25, 3), r"[\u4E00-\u9FA5]{5,7} {0,2}√", pick_flag("无", "无", "有"),
+                 r'基础:[\u4E00-\u9FA5]{6}', pick_flag("无", "无", "有")),
+    Excel01Field("屋盖情况", (26, 3), r"[\u4E00-\u9FA5]变形、腐朽或开裂 {0,2}√", pick_flag("无", "无", "有"),
+                 r'楼、屋盖构件:[\u4E00-\u9FA5]{3}、[\u4E00-\u9FA5]{5}', pick_flag("无", "无", "有")),
+    Excel01Field("填表人", (29, 3)),
+    Excel01Field("填表人联系方式", (29, 9)),
+]
+
+# 单体抗震性能调查表的表头（列顺序）
+EXCEL01_HEADS = [field.key for field in EXCEL01_SCHEMA]
+
+
+def get_excel01_dict(location: Dict[str, str], name: str, phone: str, table) -> Dict[str, str]:
+    """
+    从附件1中获取信息，各字段的抽取规则见 EXCEL01_SCHEMA
+    :param location: 包含户所在的区名、镇名、村名的字典
+    :param name: 该户姓名
+    :param phone: 该户联系方式
+    :param table: 从该户 word01 文档中解析得到的table对象或其 TableGrid 快照
+    :return: 包含 word01 文档中重要信息的字典
+    """
+    grid = table if isinstance(table, TableGrid) else TableGrid(table)
+    context = {
+        "区": location["region_name"],
+        "乡镇": location["town_name"],
+        "村庄": location["village_name"],
+        "户主": name,
+        "户主联系方式": phone,
+    }
+    normalized: Dict[Tuple[int, int], str] = {}
+    info_dic = dict()
+    for field in EXCEL01_SCHEMA:
+        info_dic[field.key] = field.extract(grid, context, normalized)
     return info_dic
 
 
 def get_excel02_dict(table) -> Dict[str, str]:
     """
     从附件2中获取信息
-    :param table: 从该户 word02 文档中解析得到的table对
+    :param table: 从该户 word02 文档中解析得到的table对象或其 TableGrid 快照
     :return: 包含 word02 文档中重要信息的字典
     """
-    table_rows = len(table.rows)
+    table = table if isinstance(table, TableGrid) else TableGrid(table)
+    table_rows = table.row_count
     info_dic = {}
     for i in range(22):
         flag = True if i < table_rows else False
         if i == 0:
-            info_dic["自然村地址"] = table.cell(0, 1).text if flag else ""
-            info_dic["住户总数（户）"] = table.cell(0, 5).text if flag else ""
-            info_dic["人口总数（口）"] = table.cell(0, 8).text if flag else ""
+            info_dic["自然村地址"] = table.text(0, 1) if flag else ""
+            info_dic["住户总数（户）"] = table.text(0, 5) if flag else ""
+            info_dic["人口总数（口）"] = table.text(0, 8) if flag else ""
         elif i == 1:
-            info_dic["房屋总数（栋）"] = table.cell(1, 1).text if flag else ""
-            info_dic["家庭平均人口（口）"] = table.cell(1, 3).text if flag else ""
-            info_dic["全村上一年经济收入（万元）"] = table.cell(1, 8).text if flag else ""
+            info_dic["房屋总数（栋）"] = table.text(1, 1) if flag else ""
+            info_dic["家庭平均人口（口）"] = table.text(1, 3) if flag else ""
+            info_dic["全村上一年经济收入（万元）"] = table.text(1, 8) if flag else ""
         elif i == 2:
-            info_dic["建筑年代"] = [table.cell(2, 1).text, table.cell(2, 3).text, table.cell(2, 5).text, table.cell(2, 7).text] \
+            info_dic["建筑年代"] = [table.text(2, 1), table.text(2, 3), table.text(2, 5), table.text(2, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 3:
-            info_dic["房屋栋数"] = [table.cell(3, 1).text, table.cell(3, 3).text, table.cell(3, 5).text, table.cell(3, 7).text] \
+            info_dic["房屋栋数"] = [table.text(3, 1), table.text(3, 3), table.text(3, 5), table.text(3, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 4:
-            info_dic["房屋结构类型"] = [table.cell(4, 1).text, table.cell(4, 3).text, table.cell(4, 5).text, table.cell(4, 7).text] \
+            info_dic["房屋结构类型"] = [table.text(4, 1), table.text(4, 3), table.text(4, 5), table.text(4, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 5:
-            info_dic["房屋间数"] = [table.cell(5, 1).text, table.cell(5, 3).text, table.cell(5, 5).text, table.cell(5, 7).text] \
+            info_dic["房屋间数"] = [table.text(5, 1), table.text(5, 3), table.text(5, 5), table.text(5, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 6:
-            info_dic["房屋尺寸"] = [table.cell(6, 1).text, table.cell(6, 3).text, table.cell(6, 5).text, table.cell(6, 7).text] \
+            info_dic["房屋尺寸"] = [table.text(6, 1), table.text(6, 3), table.text(6, 5), table.text(6, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 7:
-            info_dic["砌块类型"] = [table.cell(7, 1).text, table.cell(7, 3).text, table.cell(7, 5).text, table.cell(7, 7).text] \
+            info_dic["砌块类型"] = [table.text(7, 1), table.text(7, 3), table.text(7, 5), table.text(7, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 8:
-            info_dic["砖体粘结"] = [table.cell(8, 1).text, table.cell(8, 3).text, table.cell(8, 5).text, table.cell(8, 7).text] \
+            info_dic["砖体粘结"] = [table.text(8, 1), table.text(8, 3), table.text(8, 5), table.text(8, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 9:
-            info_dic["房屋墙体厚度"] = [table.cell(9, 1).text, table.cell(9, 3).text, table.cell(9, 5).text, table.cell(9, 7).text] \
+            info_dic["房屋墙体厚度"] = [table.text(9, 1), table.text(9, 3), table.text(9, 5), table.text(9, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 10:
-            info_dic["房屋圈梁情况"] = [table.cell(10, 1).text, table.cell(10, 3).text, table.cell(10, 5).text, table.cell(10, 7).text] \
+            info_dic["房屋圈梁情况"] = [table.text(10, 1), table.text(10, 3), table.text(10, 5), table.text(10, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 11:
-            info_dic["房屋地梁情况"] = [table.cell(11, 1).text, table.cell(11, 3).text, table.cell(11, 5).text, table.cell(11, 7).text] \
+            info_dic["房屋地梁情况"] = [table.text(11, 1), table.text(11, 3), table.text(11, 5), table.text(11, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 12:
-            info_dic["房屋构造柱情况"] = [table.cell(12, 1).text, table.cell(12, 3).text, table.cell(12, 5).text, table.cell(12, 7).text] \
+            info_dic["房屋构造柱情况"] = [table.text(12, 1), table.text(12, 3), table.text(12, 5), table.text(12, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 13:
-            info_dic["场地条件"] = [table.cell(13, 1).text, table.cell(13, 3).text, table.cell(13, 5).text, table.cell(13, 7).text] \
+            info_dic["场地条件"] = [table.text(13, 1), table.text(13, 3), table.text(13, 5), table.text(13, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 14:
-            info_dic["房屋基坑深度"] = [table.cell(14, 1).text, table.cell(14, 3).text, table.cell(14, 5).text, table.cell(14, 7).text] \
+            info_dic["房屋基坑深度"] = [table.text(14, 1), table.text(14, 3), table.text(14, 5), table.text(14, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 15:
-            info_dic["基坑回填材料"] = [table.cell(15, 1).text, table.cell(15, 3).text, table.cell(15, 5).text, table.cell(15, 7).text] \
+            info_dic["基坑回填材料"] = [table.text(15, 1), table.text(15, 3), table.text(15, 5), table.text(15, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 16:
-            info_dic["基础砌体"] = [table.cell(16, 1).text, table.cell(16, 3).text, table.cell(16, 5).text, table.cell(16, 7).text] \
+            info_dic["基础砌体"] = [table.text(16, 1), table.text(16, 3), table.text(16, 5), table.text(16, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 17:
-            info_dic["基础砌筑材料"] = [table.cell(17, 1).text, table.cell(17, 3).text, table.cell(17, 5).text, table.cell(17, 7).text] \
+            info_dic["基础砌筑材料"] = [table.text(17, 1), table.text(17, 3), table.text(17, 5), table.text(17, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 18:
-            info_dic["屋盖类别"] = [table.cell(18, 1).text, table.cell(18, 3).text, table.cell(18, 5).text, table.cell(18, 7).text] \
+            info_dic["屋盖类别"] = [table.text(18, 1), table.text(18, 3), table.text(18, 5), table.text(18, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 19:
-            info_dic["楼板类别"] = [table.cell(19, 1).text, table.cell(19, 3).text, table.cell(19, 5).text, table.cell(19, 7).text] \
+            info_dic["楼板类别"] = [table.text(19, 1), table.text(19, 3), table.text(19, 5), table.text(19, 7)] \
                 if flag \
                 else ["", "", "", ""]
         elif i == 20:
             # 有个别文档中的表格自身不规范
             try:
-                info_dic["历史震害调查"] = table.cell(20, 1).text if flag else ""
+                info_dic["历史震害调查"] = table.text(20, 1) if flag else ""
             except IndexError:
                 info_dic["历史震害调查"] = ""
         elif i == 21:
             try:
-                info_dic["备注"] = table.cell(21, 1).text if flag else ""
+                info_dic["备注"] = table.text(21, 1) if flag else ""
             except IndexError:
                 info_dic["备注"] = ""
     return info_dic
 
 
+def write_string_row(sheet, row: int, cells: List[Tuple[int, int, str, object]]) -> None:
+    """
+    写入一整行字符串，跨多列的单元格自动合并
+    :param sheet: xlsxwriter 的 worksheet 对象
+    :param row: 行号（从 0 开始）
+    :param cells: 由 (起始列号, 结束列号, 文本, 格式) 组成的列表，列号从 0 开始
+    """
+    for first_col, last_col, text, cell_format in cells:
+        if first_col == last_col:
+            sheet.write_string(row, first_col, text, cell_format)
+        else:
+            sheet.merge_range(row, first_col, row, last_col, text, cell_format)
+
+
+def write_excel01(file: str, rows: Iterable[List[str]]) -> None:
+    """
+    以 constant_memory 模式逐行写出单体抗震性能调查表，内存中只保留当前行
+    :param file: 目的文件名（绝对路径）
+    :param rows: 按 EXCEL01_HEADS 顺序排列的各户字段值，可以是生成器
+    """
+    excel = xlsxwriter.Workbook(file, {'constant_memory': True})
+    sheet01 = excel.add_worksheet(name="sheet1")
+    format01 = excel.add_format({'align': 'left', 'valign': 'vdistributed', })
+    write_string_row(sheet01, 0, [(col, col, name, format01) for col, name in enumerate(EXCEL01_HEADS)])
+    for i, values in enumerate(rows):
+        write_string_row(sheet01, i + 1, [(col, col, value, format01) for col, value in enumerate(values)])
+    excel.close()
+
+
 def dict_to_excel02(key_text: str, info_dic: dict, village_name: str, path_to_store: str):
     """
     将由 word02 文档中抽取的重要信息字典生成 excel02
@@ -468,64 +982,430 @@ def dict_to_excel02(key_text: str, info_dic: dict, village_name: str, path_to_st
     :param village_name: 该村村名
     :param path_to_store: 目的文件存储路径
     """
-    excel = xlsxwriter.Workbook(path.join(path_to_store, "整体抗震性能统计表.xlsx"), {'constant_memory': False})
+    excel = xlsxwriter.Workbook(path.join(path_to_store, "整体抗震性能统计表.xlsx"), {'constant_memory': True})
     format01 = excel.add_format({'align': 'center', 'valign': 'vdistributed', })
     format02 = excel.add_format({'align': 'left', 'valign': 'vdistributed', })
     sheet01 = excel.add_worksheet(name="sheet1")
-    sheet01.merge_range("A1:I1", f"附件2-{village_name}农居整体抗震性能统计表（加盖公章）", format01)
-    sheet01.merge_range("A2:I2", key_text, format01)
-    sheet01.write_string("A3", "自然村地址")
-    sheet01.merge_range("B3:C3", info_dic["自然村地址"], format02)
-    sheet01.merge_range("D3:E3", "住户总数（户）", format02)
-    sheet01.write_string("F3", info_dic["住户总数（户）"], format02)
-    sheet01.merge_range("G3:H3", "人口总数（口）", format02)
-    sheet01.write_string("I3", info_dic["人口总数（口）"], format02)
-    sheet01.write_string("A4", "房屋总数（栋）", format02)
-    sheet01.write_string("B4", info_dic["房屋总数（栋）"], format02)
-    sheet01.write_string("C4", "家庭平均人口（口）", format02)
-    sheet01.write_string("D4", info_dic["家庭平均人口（口）"], format02)
-    sheet01.merge_range("E4:G4", "全村上一年经济收入（万元）", format02)
-    sheet01.merge_range("H4:I4", info_dic["全村上一年经济收入（万元）"], format02)
     key_list = [
         "建筑年代", "房屋栋数", "房屋结构类型", "房屋间数", "房屋尺寸", "砌块类型", "砖体粘结", "房屋墙体厚度", "房屋圈梁情况",
         "房屋地梁情况", "房屋构造柱情况", "场地条件", "房屋基坑深度", "基坑回填材料", "基础砌体", "基础砌筑材料", "屋盖类别", "楼板类别"
     ]
-    for i in range(0, len(key_list)):
-        sheet01.write_string(f"A{i + 5}", key_list[i])
-        sheet01.merge_range(f"B{i + 5}:C{i + 5}", info_dic[key_list[i]][0], format02)
-        sheet01.merge_range(f"D{i + 5}:E{i + 5}", info_dic[key_list[i]][1], format02)
-        sheet01.merge_range(f"F{i + 5}:G{i + 5}", info_dic[key_list[i]][2], format02)
-        sheet01.merge_range(f"H{i + 5}:I{i + 5}", info_dic[key_list[i]][3], format02)
-    sheet01.write_string("A23", "历史震害调查", format02)
-    sheet01.merge_range("B23:I23", info_dic["历史震害调查"], format02)
-    sheet01.write_string("A24", "备注", format02)
-    sheet01.merge_range("B24:I24", info_dic["备注"], format02)
+    # 按行排列，constant_memory 模式要求逐行写入
+    rows = [
+        [(0, 8, f"附件2-{village_name}农居整体抗震性能统计表（加盖公章）", format01)],
+        [(0, 8, key_text, format01)],
+        [
+            (0, 0, "自然村地址", None), (1, 2, info_dic["自然村地址"], format02),
+            (3, 4, "住户总数（户）", format02), (5, 5, info_dic["住户总数（户）"], format02),
+            (6, 7, "人口总数（口）", format02), (8, 8, info_dic["人口总数（口）"], format02),
+        ],
+        [
+            (0, 0, "房屋总数（栋）", format02), (1, 1, info_dic["房屋总数（栋）"], format02),
+            (2, 2, "家庭平均人口（口）", format02), (3, 3, info_dic["家庭平均人口（口）"], format02),
+            (4, 6, "全村上一年经济收入（万元）", format02), (7, 8, info_dic["全村上一年经济收入（万元）"], format02),
+        ],
+    ]
+    for key in key_list:
+        rows.append([
+            (0, 0, key, None), (1, 2, info_dic[key][0], format02), (3, 4, info_dic[key][1], format02),
+            (5, 6, info_dic[key][2], format02), (7, 8, info_dic[key][3], format02),
+        ])
+    rows.append([(0, 0, "历史震害调查", format02), (1, 8, info_dic["历史震害调查"], format02)])
+    rows.append([(0, 0, "备注", format02), (1, 8, info_dic["备注"], format02)])
+    for row, cells in enumerate(rows):
+        write_string_row(sheet01, row, cells)
     excel.close()
 
 
+class FileEntry(object):
+    """
+    目录扫描得到的条目，类型在扫描时取得；大小和修改时间在首次访问时才读取，
+    只需要区分文件与文件夹时不会产生额外的 stat（Windows 下 scandir 已缓存 stat 信息）
+    """
+    __slots__ = ("name", "path", "is_dir", "__entry", "__size", "__mtime")
+
+    def __init__(self, name: str, path: str, is_dir: bool, size: int = None, mtime: float = None, entry: os.DirEntry = None):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.__entry = entry
+        self.__size = size
+        self.__mtime = mtime
+
+    @classmethod
+    def from_dir_entry(cls, entry: os.DirEntry) -> "FileEntry":
+        if entry.is_dir():
+            return cls(entry.name, entry.path, True, 0, 0.0)
+        return cls(entry.name, entry.path, False, entry=entry)
+
+    def __stat(self) -> None:
+        try:
+            stat = self.__entry.stat() if self.__entry is not None else os.stat(self.path)
+            self.__size, self.__mtime = stat.st_size, stat.st_mtime
+        except OSError:
+            # 如失效的符号链接
+            self.__size, self.__mtime = 0, 0.0
+        self.__entry = None
+
+    @property
+    def size(self) -> int:
+        if self.__size is None:
+            self.__stat()
+        return self.__size
+
+    @property
+    def mtime(self) -> float:
+        if self.__mtime is None:
+            self.__stat()
+        return self.__mtime
+
+    def __getstate__(self):
+        # os.DirEntry 不能序列化，序列化前先读取大小和修改时间
+        return self.name, self.path, self.is_dir, self.size, self.mtime
+
+    def __setstate__(self, state):
+        self.name, self.path, self.is_dir, self.__size, self.__mtime = state
+        self.__entry = None
+
+    def __repr__(self):
+        return f"FileEntry({self.path!r})"
+
+
+class FileRecord(object):
+    """
+    substances 中的一个文件
+    """
+    __slots__ = ("path", "kind", "size", "source", "digest")
+
+    def __init__(self, path: str, kind: str, size: int = None, source: str = None, digest: str = None):
+        """
+        :param path: 文件名（绝对路径）
+        :param kind: 所属类别
+        :param size: 文件大小（字节），未知时为None
+        :param source: 扫描前的原始文件名，为None时与 path 相同
+        :param digest: 文件内容的 sha1 摘要，未知时为None
+        """
+        self.path = path
+        self.kind = kind
+        self.size = size
+        self.source = source or path
+        self.digest = digest
+
+    def __repr__(self):
+        return f"FileRecord({self.path!r}, {self.kind!r})"
+
+
+class SubstanceList(object):
+    """
+    substances 中某一类别的文件：保持加入顺序，以哈希表判断是否存在，重复加入的文件被忽略
+    用法与文件名列表相同（下标、append、pop、len、in、迭代）
+    """
+    __slots__ = ("kind", "__paths", "__records")
+
+    def __init__(self, kind: str, files: Iterable[Union[str, FileRecord]] = ()):
+        self.kind = kind
+        self.__paths: List[str] = []
+        self.__records: Dict[str, FileRecord] = {}
+        self.extend(files)
+
+    def append(self, file: Union[str, FileRecord]) -> None:
+        record = file if isinstance(file, FileRecord) else FileRecord(file, self.kind)
+        if record.path not in self.__records:
+            self.__records[record.path] = record
+            self.__paths.append(record.path)
+
+    def extend(self, files: Iterable[Union[str, FileRecord]]) -> None:
+        for file in files:
+            self.append(file)
+
+    def pop(self, index: int = -1) -> str:
+        file = self.__paths.pop(index)
+        del self.__records[file]
+        return file
+
+    def remove(self, file: str) -> None:
+        del self.__records[file]
+        self.__paths.remove(file)
+
+    def record(self, file: str) -> FileRecord:
+        return self.__records[file]
+
+    def records(self) -> List[FileRecord]:
+        return [self.__records[file] for file in self.__paths]
+
+    def __getitem__(self, index):
+        return self.__paths[index]
+
+    def __len__(self):
+        return len(self.__paths)
+
+    def __iter__(self):
+        return iter(self.__paths)
+
+    def __contains__(self, file):
+        return file in self.__records
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(self.__paths)
+
+
+class Substances(object):
+    """
+    按类别索引的文件集合，用法与 {类别: 文件名列表} 的字典相同
+    """
+    __slots__ = ("__kinds",)
+
+    def __init__(self, kinds: Iterable[str]):
+        self.__kinds: Dict[str, SubstanceList] = {kind: SubstanceList(kind) for kind in kinds}
+
+    def add(self, file: str, kind: str, size: int = None, source: str = None, digest: str = None) -> None:
+        self.__kinds[kind].append(FileRecord(file, kind, size, source, digest))
+
+    def find(self, file: str) -> Union[str, None]:
+        """
+        :return: 文件所属的第一个类别，不存在时为None
+        """
+        for kind, files in self.__kinds.items():
+            if file in files:
+                return kind
+        return None
+
+    def __getitem__(self, kind: str) -> SubstanceList:
+        return self.__kinds[kind]
+
+    def __setitem__(self, kind: str, files: Iterable[Union[str, FileRecord]]):
+        self.__kinds[kind] = files if isinstance(files, SubstanceList) else SubstanceList(kind, files)
+
+    def keys(self):
+        return self.__kinds.keys()
+
+    def values(self):
+        return self.__kinds.values()
+
+    def items(self):
+        return self.__kinds.items()
+
+    def __iter__(self):
+        return iter(self.__kinds)
+
+    def __len__(self):
+        return len(self.__kinds)
+
+    def __contains__(self, kind):
+        return kind in self.__kinds
+
+    def __repr__(self):
+        return repr(self.__kinds)
+
+
+def list_dir(root_path: str) -> List[FileEntry]:
+    """
+    列出 root_path 下的直接子项（不递归）
+    :param root_path: 被查找目录
+    :return: 包含 FileEntry 的列表，顺序与 os.listdir 相同
+    """
+    with os.scandir(root_path) as entries:
+        return [FileEntry.from_dir_entry(entry) for entry in entries]
+
+
+def walk_files(root_path: str):
+    """
+    查找 root_path 下的所有文件，使用显式栈代替递归，嵌套再深也不会超出调用栈
+    :param root_path: 被查找根目录
+    :return: 逐个产生 FileEntry 的生成器，顺序与递归的 get_filepath 相同
+    """
+    stack = [iter(list_dir(root_path))]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+        elif entry.is_dir:
+            stack.append(iter(list_dir(entry.path)))
+        else:
+            yield entry
+
+
 def get_filepath(root_path: str, file_list=List[str]) -> List[str]:
     """
-    递归查找 root_path 下的所有文件
+    查找 root_path 下的所有文件
     :param root_path: 被查找根目录
     :param file_list: 用来存储 root_path 下所有文件路径的列表，初始值赋空列表 []
     :return: 包含 root_path 下所有文件路径的列表
     """
     if file_list is None:
         file_list = []
-    for file in os.listdir(root_path):
-        file_path = path.join(root_path, file)
-        if path.isdir(file_path):
-            get_filepath(file_path, file_list)
-        else:
-            file_list.append(file_path)
+    file_list.extend(entry.path for entry in walk_files(root_path))
     return file_list
 
 
+class ScanPipeline(object):
+    """
+    流水线式扫描：发现、转换、分类、归档四个阶段，阶段之间以有界队列连接，
+    转换旧格式文件的同时可以解析已经转换好的文件，结果按发现顺序返回
+    """
+
+    def __init__(self, classify: Callable[[str], List[str]], store: convert.ConvertStore = None,
+                 on_failure: Callable[[str, Exception], None] = None, queue_size: int = 16, batch_size: int = 8,
+                 on_convert: Callable[[str, str], None] = None):
+        """
+        :param classify: 分类函数，文件名（绝对路径） -> 所属类别列表
+        :param store: 转换结果存储，为None时不使用
+        :param on_failure: 文件转换失败时的回调，转换失败的文件额外归入"cache"
+        :param queue_size: 阶段之间队列的最大长度
+        :param batch_size: 转换阶段一次最多合并转换的文件数
+        :param on_convert: 文件转换成功时的回调 (源文件名, 转换后的文件名)，在分类之前调用
+        """
+        self.__classify = classify
+        self.__store = store
+        self.__on_failure = on_failure
+        self.__queue_size = queue_size
+        self.__batch_size = batch_size
+        self.__on_convert = on_convert
+
+    def run(self, files: Iterable[str]) -> List[Tuple[str, str]]:
+        """
+        :param files: 发现阶段，逐个产生文件名（绝对路径）的可迭代对象
+        :return: 按发现顺序排列的 (类别, 文件名) 列表
+        """
+        convert_queue, classify_queue, place_queue = (queue.Queue(self.__queue_size) for _ in range(3))
+        errors: List[Exception] = []
+
+        def discovery():
+            try:
+                for index, file in enumerate(files):
+                    if errors:
+                        break
+                    if file.endswith(tuple(convert.CONVERT_SUFFIXES)):
+                        convert_queue.put((index, file, None))
+                    else:
+                        classify_queue.put((index, file, None))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                convert_queue.put(None)
+
+        def conversion():
+            end = False
+            while not end:
+                # 取出当前已发现的旧格式文件，在同一个会话中批量转换
+                batch = [convert_queue.get()]
+                while batch[-1] is not None and len(batch) < self.__batch_size:
+                    try:
+                        batch.append(convert_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if batch[-1] is None:
+                    end = True
+                    batch.pop()
+                if not batch or errors:
+                    continue
+                try:
+                    converted = convert.get_pool().convert_batch([file for _, file, _ in batch], self.__store)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                for index, file, _ in batch:
+                    if isinstance(converted[file], Exception):
+                        classify_queue.put((index, file, converted[file]))
+                    else:
+                        if self.__on_convert is not None:
+                            self.__on_convert(file, converted[file])
+                        classify_queue.put((index, converted[file], None))
+            classify_queue.put(None)
+
+        def classification():
+            while True:
+                item = classify_queue.get()
+                if item is None:
+                    break
+                if errors:
+                    # 出错后继续取出剩余文件，避免上游阶段阻塞
+                    continue
+                index, file, error = item
+                kinds = []
+                try:
+                    if error is not None:
+                        if self.__on_failure is not None:
+                            self.__on_failure(file, error)
+                        kinds.append("cache")
+                    kinds.extend(self.__classify(file))
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                place_queue.put((index, kinds, file))
+            place_queue.put(None)
+
+        threads = [threading.Thread(target=stage, daemon=True) for stage in (discovery, conversion, classification)]
+        for thread in threads:
+            thread.start()
+        # 归档阶段：收集分类结果后按发现顺序排列，保证结果确定
+        placed = []
+        for item in iter(place_queue.get, None):
+            placed.append(item)
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        placed.sort(key=lambda item: item[0])
+        return [(kind, file) for _, kinds, file in placed for kind in kinds]
+
+
+def run_stages(tasks: Dict[str, Callable[[], None]], dependencies: Dict[str, Tuple[str, ...]], workers: int = 1) -> Dict[str, Union[Exception, None]]:
+    """
+    按依赖关系执行多个处理阶段，互不依赖的阶段在线程池中并发执行
+    :param tasks: 阶段名 -> 处理函数，按字典顺序优先执行
+    :param dependencies: 阶段名 -> 必须先完成的阶段名
+    :param workers: 最多同时执行的阶段数，为 1 时按 tasks 的顺序串行执行
+    :return: 阶段名 -> 执行时抛出的异常，正常完成时为None；所依赖的阶段出错时不再执行，记为对应的异常
+    """
+    outcomes: Dict[str, Union[Exception, None]] = {}
+    pending = list(tasks)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                if len(running) >= max(workers, 1):
+                    break
+                depends = dependencies.get(name, ())
+                if not all(depend in outcomes for depend in depends):
+                    continue
+                pending.remove(name)
+                failed = [outcomes[depend] for depend in depends if outcomes[depend] is not None]
+                if failed:
+                    outcomes[name] = failed[0]
+                else:
+                    running[executor.submit(tasks[name])] = name
+            if not running:
+                if pending:
+                    raise ValueError(f"unresolvable stage dependencies: {pending}")
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcomes[running.pop(future)] = future.exception()
+    return {name: outcomes[name] for name in tasks}
+
+
+def get_dir_weight(root_path: str) -> Tuple[int, int]:
+    """
+    统计 root_path 下的文件数量与总字节数，用于估计处理耗时
+    :param root_path: 被统计根目录
+    :return: (文件数量, 总字节数)
+    """
+    count, size = 0, 0
+    for entry in walk_files(root_path):
+        count += 1
+        size += entry.size
+    return count, size
+
+
 def release_dir(parent_path: str, src_dir: str):
     sub_dirs = os.listdir(
         path.join(parent_path, src_dir))
     for sub_dir in sub_dirs:
-        os.rename(
+        move.move(
             path.join(parent_path, src_dir, sub_dir),
             path.join(parent_path, sub_dir))
     os.removedirs(
@@ -540,7 +1420,7 @@ def repeat_dir_remove(parent_path: str, src_dir: str):
             dirs = os.listdir(
                 path.join(parent_path, src_dir, repeat_dir))
             for d in dirs:
-                os.rename(
+                move.move(
                     path.join(parent_path, src_dir, repeat_dir, d),
                     path.join(parent_path, src_dir, d))
             os.removedirs(
@@ -593,42 +1473,176 @@ def village_dir_rename(village_dir: str):
     return village_dir
 
 
-def clean_region_dir(region_path: str):
+def snapshot_dir(root_path: str, depth: int) -> Dict[str, Union[dict, None]]:
+    """
+    读取 root_path 下 depth 层以内的目录结构
+    :param root_path: 被读取的目录
+    :param depth: 读取的层数，超出层数的目录记为空字典
+    :return: 名称 -> 子目录结构（文件为None）
+    """
+    tree = {}
+    for entry in list_dir(root_path):
+        if not entry.is_dir:
+            tree[entry.name] = None
+        elif depth > 1:
+            tree[entry.name] = snapshot_dir(entry.path, depth - 1)
+        else:
+            tree[entry.name] = {}
+    return tree
+
+
+class DirPlan(object):
+    """
+    目录整理计划：在内存中的目录快照上模拟重命名和移动，记录需要执行的操作，最后一次性执行
+    """
+
+    def __init__(self, root_path: str, tree: Dict[str, Union[dict, None]]):
+        """
+        :param root_path: 快照的根目录，计划中的路径均相对于该目录
+        :param tree: 根目录的快照，见 snapshot_dir
+        """
+        self.__root_path = root_path
+        self.__tree = tree
+        self.__operations: List[Tuple[str, str, str]] = []
+        self.__collisions: List[Tuple[str, str]] = []
+
+    def node(self, *names: str) -> Union[dict, None]:
+        """
+        快照中某一目录的子项
+        :param names: 相对于根目录的各级名称
+        """
+        node = self.__tree
+        for name in names:
+            node = node[name]
+        return node
+
+    def dirs(self, *names: str) -> List[str]:
+        """
+        快照中某一目录下的子目录名
+        """
+        return [name for name, child in self.node(*names).items() if child is not None]
+
+    def move(self, src: Tuple[str, ...], dst: Tuple[str, ...]) -> bool:
+        """
+        计划将 src 移动（重命名）为 dst，dst 已存在时记为冲突并放弃该操作
+        :param src: 源路径各级名称
+        :param dst: 目的路径各级名称
+        :return: 是否计划了该操作
+        """
+        if src == dst:
+            return True
+        src_parent, dst_parent = self.node(*src[:-1]), self.node(*dst[:-1])
+        if dst[-1] in dst_parent:
+            self.__collisions.append((self.path(*src), self.path(*dst)))
+            return False
+        dst_parent[dst[-1]] = src_parent.pop(src[-1])
+        self.__operations.append(("rename", self.path(*src), self.path(*dst)))
+        return True
+
+    def release(self, *names: str) -> None:
+        """
+        计划将目录中的所有子项上移一层，并删除该目录（同 release_dir）
+        :param names: 被释放目录的各级名称
+        """
+        for name in list(self.node(*names)):
+            self.move(names + (name,), names[:-1] + (name,))
+        if not self.node(*names):
+            self.node(*names[:-1]).pop(names[-1])
+            self.__operations.append(("rmdir", self.path(*names), ""))
+
+    def repeat_remove(self, *names: str) -> None:
+        """
+        计划删除目录中与其同名的嵌套目录（同 repeat_dir_remove）
+        :param names: 目录的各级名称
+        """
+        if self.node(*names).get(names[-1]) is not None:
+            self.release(*names, names[-1])
+
+    def path(self, *names: str) -> str:
+        return path.join(self.__root_path, *names)
+
+    def apply(self) -> None:
+        """
+        按顺序执行计划中的所有操作
+        """
+        for operation, src, dst in self.__operations:
+            if operation == "rename":
+                move.move(src, dst)
+            else:
+                os.rmdir(src)
+
+    def print(self) -> None:
+        """
+        打印计划而不执行（dry run）
+        """
+        for operation, src, dst in self.__operations:
+            print(f"{operation}: {src}" + (f" -> {dst}" if dst else ""))
+        for src, dst in self.__collisions:
+            print(f"collision: {src} -> {dst}")
+
+    @property
+    def operations(self):
+        return self.__operations
+
+    @property
+    def collisions(self):
+        return self.__collisions
+
+
+def plan_region_dir(region_path: str) -> DirPlan:
+    """
+    根据区目录的快照计算规范化整理计划，规则与原来逐步整理时相同
+    :param region_path: 区目录（绝对路径）
+    :return: 整理计划
+    """
+    root_path, region_dir = path.split(path.normpath(region_path))
+    # 区、镇、（汇总文件夹）、村、（汇总文件夹）、材料，最多需要 6 层
+    tree = {entry.name: ({} if entry.is_dir else None) for entry in list_dir(root_path)}
+    tree[region_dir] = snapshot_dir(region_path, 6)
+    plan = DirPlan(root_path, tree)
     # 重命名当前区
-    region_dir = region_path.split('\\')[-1]
-    root_path = region_path.replace(region_dir, '')
-    repeat_dir_remove(root_path, region_dir)
-    region_dir = region_dir_rename(region_dir)
-    os.rename(region_path, path.join(root_path, region_dir))
-    region_path = path.join(root_path, region_dir)
+    plan.repeat_remove(region_dir)
+    new_dir = region_dir_rename(region_dir)
+    if plan.move((region_dir,), (new_dir,)):
+        region_dir = new_dir
     # 重命名区中的每一个镇或者街道
-    town_dirs = [d for d in os.listdir(region_path) if path.isdir(path.join(region_path, d))]
-    new_town_dirs = []
-    for town_dir in town_dirs:
+    town_dirs = []
+    for town_dir in plan.dirs(region_dir):
         # 删除该路径下重名的嵌套路径
-        repeat_dir_remove(region_path, town_dir)
+        plan.repeat_remove(region_dir, town_dir)
         # 重命名镇、街道
         new_dir = town_dir_rename(town_dir)
-        os.rename(path.join(region_path, town_dir), path.join(region_path, new_dir))
-        new_town_dirs.append(new_dir)
-    town_dirs = new_town_dirs
+        town_dirs.append(new_dir if plan.move((region_dir, town_dir), (region_dir, new_dir)) else town_dir)
     # 重命名每一个村
     for town_dir in town_dirs:
-        town_path = path.join(region_path, town_dir)
-        village_dirs = [d for d in os.listdir(town_path) if path.isdir(path.join(town_path, d))]
+        village_dirs = plan.dirs(region_dir, town_dir)
         # 个别镇中把所有的村又多汇总了一层文件夹
-        if len(village_dirs) == 1 and len(os.listdir(path.join(town_path, village_dirs[0]))) >= 6:
-            release_dir(town_path, village_dirs[0])
-            village_dirs = [d for d in os.listdir(town_path) if path.isdir(path.join(town_path, d))]
+        if len(village_dirs) == 1 and len(plan.node(region_dir, town_dir, village_dirs[0])) >= 6:
+            plan.release(region_dir, town_dir, village_dirs[0])
+            village_dirs = plan.dirs(region_dir, town_dir)
         for village_dir in village_dirs:
-            village_path = path.join(town_path, village_dir)
             # 个别村中又把所有文件多汇总了一层文件夹
-            substance_dirs = [d for d in os.listdir(village_path)]
-            if len(substance_dirs) == 1 and len(os.listdir(path.join(village_path, substance_dirs[0]))) >= 2:
-                release_dir(village_path, substance_dirs[0])
-            # repeat_dir_remove(path.join(region_path, town_dir), village_dir)
+            substance_dirs = list(plan.node(region_dir, town_dir, village_dir))
+            if len(substance_dirs) == 1 and len(plan.node(region_dir, town_dir, village_dir, substance_dirs[0]) or ()) >= 2:
+                plan.release(region_dir, town_dir, village_dir, substance_dirs[0])
             new_dir = village_dir_rename(village_dir)
-            os.rename(path.join(town_path, village_dir), path.join(town_path, new_dir))
+            plan.move((region_dir, town_dir, village_dir), (region_dir, town_dir, new_dir))
+    return plan
+
+
+def clean_region_dir(region_path: str, dry_run: bool = False) -> DirPlan:
+    """
+    规范化整理区目录：先根据一次性读取的目录快照计算整理计划，再批量执行
+    :param region_path: 区目录（绝对路径）
+    :param dry_run: 为True时只打印计划，不做任何修改
+    :return: 整理计划
+    """
+    plan = plan_region_dir(region_path)
+    if dry_run:
+        plan.print()
+    else:
+        plan.apply()
+    return plan
 
 
 def photo_find_number(photo_name: str) -> Union[str, None]:
@@ -658,6 +1672,162 @@ def photo_find_name(photo_name: str) -> Union[str, None]:
     pass
 
 
+def photo_digest(file: str) -> str:
+    """
+    以内存映射的方式分块计算照片内容摘要，不把整个文件读入内存
+    :param file: 文件名（绝对路径）
+    :return: sha1 摘要
+    """
+    sha1 = hashlib.sha1()
+    with open(file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return sha1.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            view = memoryview(m)
+            try:
+                for offset in range(0, len(m), 1 << 20):
+                    sha1.update(view[offset:offset + (1 << 20)])
+            finally:
+                view.release()
+    return sha1.hexdigest()
+
+
+def find_duplicates(files: List[str], scopes: List[str] = None, workers: int = 4) -> Dict[str, str]:
+    """
+    查找内容相同的文件：先比较大小，只有大小相同的文件才计算摘要（多线程并行）
+    :param files: 文件名（绝对路径）的列表
+    :param scopes: 与 files 一一对应的范围名，只在同一范围内查找重复，为None时全部属于同一范围
+    :param workers: 计算摘要的线程数
+    :return: 重复文件 -> 同一范围内第一个内容相同的文件
+    """
+    scopes = scopes or [""] * len(files)
+    by_size: Dict[Tuple[str, int], List[str]] = {}
+    for file, scope in zip(files, scopes):
+        by_size.setdefault((scope, path.getsize(file)), []).append(file)
+    candidates = [(scope, file) for (scope, _), group in by_size.items() if len(group) > 1 for file in group]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        digests = list(executor.map(photo_digest, [file for _, file in candidates]))
+    canonical: Dict[Tuple[str, str], str] = {}
+    duplicates = {}
+    order = {file: i for i, file in enumerate(files)}
+    for (scope, file), digest in sorted(zip(candidates, digests), key=lambda item: order[item[0][1]]):
+        kept = canonical.setdefault((scope, digest), file)
+        if kept != file:
+            duplicates[file] = kept
+    return duplicates
+
+
+def docx_body_elements(file: str):
+    """
+    按文档顺序流式遍历 docx 正文中的段落与表格，已遍历的元素会被及时清空
+    :param file: 文件名（绝对路径）
+    :return: 生成 (标签名, lxml 元素) 的迭代器，标签名为 "p"、"tbl" 等
+    """
+    with zipfile.ZipFile(file) as docx:
+        with docx.open(docx_main_part(docx)) as document:
+            for _, elem in etree.iterparse(document, events=("end",)):
+                parent = elem.getparent()
+                if parent is None or xml_tag(parent) != "body":
+                    continue
+                yield xml_tag(elem), elem
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del parent[0]
+
+
+@lru_cache(maxsize=1)
+def docx_template() -> Tuple[Tuple[Tuple[str, bytes], ...], str]:
+    """
+    python-docx 默认空白文档的内容，用于直接生成新的 docx 文档
+    :return: (压缩包内各文件名及内容, 正文部分的文件名)
+    """
+    buffer = io.BytesIO()
+    dx.Document().save(buffer)
+    with zipfile.ZipFile(buffer) as docx:
+        main_part = docx_main_part(docx)
+        members = tuple((info.filename, docx.read(info)) for info in docx.infolist())
+    return members, main_part
+
+
+def docx_write_table(file: str, text: str, tbl) -> None:
+    """
+    由空白文档模板生成只包含一个段落和一个表格的 docx 文档
+    :param file: 目的文件名（绝对路径）
+    :param text: 段落文本
+    :param tbl: 表格的 lxml 元素，写入的是其副本
+    """
+    members, main_part = docx_template()
+    document = dx.oxml.parse_xml(dict(members)[main_part])
+    body = xml_child(document, "body")
+    paragraph = dx.text.paragraph.Paragraph(dx.oxml.parse_xml(f"<w:p {dx.oxml.ns.nsdecls('w')}/>"), None)
+    paragraph.add_run(text)
+    sect_pr = xml_child(body, "sectPr")
+    if sect_pr is not None:
+        sect_pr.addprevious(paragraph._p)
+    else:
+        body.append(paragraph._p)
+    paragraph._p.addnext(deepcopy(tbl))
+    with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as docx:
+        for name, content in members:
+            if name == main_part:
+                content = etree.tostring(document, encoding="UTF-8", standalone=True)
+            docx.writestr(name, content)
+
+
+class Word01Record(object):
+    """
+    拆分附件1时得到的一户记录，供生成 excel01 时直接使用，无需再次解析拆分后的文档
+    """
+    __slots__ = ("__info_text", "__grid")
+
+    def __init__(self, info_text: str, grid: TableGrid):
+        """
+        :param info_text: 该户文档中包含户主与联系方式的段落文本
+        :param grid: 该户表格的 TableGrid 快照
+        """
+        self.__info_text = info_text
+        self.__grid = grid
+
+    @property
+    def info_text(self):
+        return self.__info_text
+
+    @property
+    def grid(self):
+        return self.__grid
+
+
+def word01_info_text(docx) -> str:
+    """
+    查找 word01 文档中包含户主与联系方式的段落
+    :param docx: python-docx 的 Document 对象
+    :return: 最后一个同时包含户主与联系方式的段落文本，没有则返回空字符串
+    """
+    info_text = ""
+    for paragraph in docx.paragraphs:
+        text: str = paragraph.text
+        if text.find("户主") != -1 and text.find("联系方式") != -1:
+            info_text = text
+    return info_text
+
+
+def word01_name_phone(info_text: str) -> Tuple[str, str]:
+    """
+    从户主信息段落中提取户主姓名与联系方式
+    :param info_text: 包含户主与联系方式的段落文本
+    :return: (户主姓名, 联系方式)
+    """
+    name_found = re.findall(r"[\u4E00-\u9FA5]{2,4}", info_text)
+    phone_found = re.findall(r"\d{8,11}", info_text)
+    name_found.remove("户主")
+    name_found.remove("联系方式")
+    if "时间" in name_found:
+        name_found.remove("时间")
+    elif "日期" in name_found:
+        name_found.remove("日期")
+    return name_found[0] if name_found else "", phone_found[0] if phone_found else ""
+
+
 class VillageWord01Handle:
 
     @staticmethod
@@ -668,11 +1838,13 @@ class VillageWord01Handle:
         pass
 
     @staticmethod
-    def case01(path_to_store: str, docx_file: str) -> None:
+    def case01(path_to_store: str, docx_file: str, records: Dict[str, Word01Record] = None) -> None:
         """
         所有被抽查户的附件一同意存在一个文档中时的处理方案
+        流式读取正文两遍：第一遍收集户主信息与各户表格编号，第二遍将各户表格直接写入由模板生成的新文档
         :param path_to_store: 目的文件存储路径
         :param docx_file: 文件名（绝对路径）
+        :param records: 不为None时，以拆分后的文件名为键存入各户的 Word01Record
         """
         if not path.exists(path_to_store):
             os.mkdir(path_to_store)
@@ -680,75 +1852,77 @@ class VillageWord01Handle:
             docx_file = doc_to_docx(docx_file)
         elif docx_file.endswith('.wps'):
             docx_file = wps_to_docx(docx_file)
-        docx = dx.Document(docx_file)
-        paragraphs: List[dx.text.paragraph] = docx.paragraphs
-        tables: List[dx.table.Table] = docx.tables
         info_dic = {'name': [], 'phone': [], 'date': []}
-        # 寻找附件1的信息
-        for paragraph in paragraphs:
-            text: str = paragraph.text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace(',', '.').replace('，', '.')
-            if text.find('户主') != -1:
-                name_found = re.findall(r'户主 *[:：] *[\u4e00-\u9fa5]{1,3}', text)
-                if name_found:
-                    name: str = name_found[0]
-                    name = name.split(':')[-1]
-                    info_dic['name'].append(name)
-                else:
-                    info_dic['name'].append("")
-            if text.find('联系') != -1:
-                phone_found = re.findall(r'\d{8,11}', text)  # 查找电话号码 可能需要更加精细
-                if phone_found:
-                    phone = phone_found[0]
-                    info_dic['phone'].append(phone)
-                else:
-                    info_dic['phone'].append("")
-            if text.find('时间') != -1:
-                date_found = re.findall(r'\d{4}[.年]\d{1,2}[.月]\d{1,2}日?', text)
-                # 存在问题 日期如20220825 匹配不到 若修改为 r'\d{4}[.年]?\d{1,2}[.月]?\d{1,2}日?' 会有手机号码冲突
-                if date_found:
-                    date = date_found[0]
-                    info_dic['date'].append(date)
-                else:
-                    info_dic['date'].append("")
+        tables_new = []  # 各户表格在正文表格中的序号及其编号
+        table_serial = 0
+        for tag, elem in docx_body_elements(docx_file):
+            if tag == "p":
+                # 寻找附件1的信息
+                paragraph = dx.text.paragraph.Paragraph(dx.oxml.parse_xml(etree.tostring(elem)), None)
+                text: str = paragraph.text.replace(' ', '').replace('：', ':').replace(';', ':').replace('；', ':').replace(',', '.').replace('，', '.')
+                if text.find('户主') != -1:
+                    name_found = re.findall(r'户主 *[:：] *[\u4e00-\u9fa5]{1,3}', text)
+                    if name_found:
+                        name: str = name_found[0]
+                        name = name.split(':')[-1]
+                        info_dic['name'].append(name)
+                    else:
+                        info_dic['name'].append("")
+                if text.find('联系') != -1:
+                    phone_found = re.findall(r'\d{8,11}', text)  # 查找电话号码 可能需要更加精细
+                    if phone_found:
+                        phone = phone_found[0]
+                        info_dic['phone'].append(phone)
+                    else:
+                        info_dic['phone'].append("")
+                if text.find('时间') != -1:
+                    date_found = re.findall(r'\d{4}[.年]\d{1,2}[.月]\d{1,2}日?', text)
+                    # 存在问题 日期如20220825 匹配不到 若修改为 r'\d{4}[.年]?\d{1,2}[.月]?\d{1,2}日?' 会有手机号码冲突
+                    if date_found:
+                        date = date_found[0]
+                        info_dic['date'].append(date)
+                    else:
+                        info_dic['date'].append("")
+            elif tag == "tbl":
+                grid = TableGrid(dx.table.Table(dx.oxml.parse_xml(etree.tostring(elem)), None))
+                if grid.cell_count >= 100 and grid.text(0, 1) == "编号":
+                    tables_new.append((table_serial, grid.text(0, 2).replace('\n', '').replace(' ', ''), grid))
+                table_serial += 1
         info = [
             f"户主:{info_dic['name'][i]}     联系方式:{info_dic['phone'][i]}     日期:{info_dic['date'][i]}"
             for i in range(len(info_dic['name']))
         ]
-        tables_new = [
-            table
-            for table in tables
-            if len(table._cells) >= 100 and table.cell(0, 1).text == "编号"
-        ]
+        # 编号重复时以最后一个表格为准
         docx_element_dic = {
-            tables_new[i].cell(0, 2).text.replace('\n', '').replace(' ', ''): (info[i], tables_new[i])
+            tables_new[i][1]: (info[i], tables_new[i][0], tables_new[i][2])
             for i in range(len(tables_new))
         }
-        name_dic = dict()
-        for name, (paragraph, table) in docx_element_dic.items():
-            docx = dx.Document()
-            new_paragraph = docx.add_paragraph(paragraph)
-            # ————————
-            # trick: 将原word中的表格复制到新表格中去（https://learnku.com/python/t/52624）
-            new_table = deepcopy(table)
-            new_paragraph._p.addnext(new_table._element)
-            # ————————
-            if name not in name_dic.keys():
-                name_dic[name] = 0
-            if not path.exists(path.join(path_to_store, f"{name}.docx")):
-                #  可能存在编号重叠错误
-                docx.save(path.join(path_to_store, f"{name}.docx"))
-                name_dic[name] = 0
-            else:
-                docx.save(path.join(path_to_store, f"{name}-{name_dic[name] + 1:02d}.docx"))
-                name_dic[name] += 1
+        # 确定每户的文件名，已存在同名文件时加序号
+        existed_files = set(os.listdir(path_to_store))
+        to_write = dict()
+        for name, (paragraph, serial, grid) in docx_element_dic.items():
+            #  可能存在编号重叠错误
+            file_name = f"{name}.docx" if f"{name}.docx" not in existed_files else f"{name}-01.docx"
+            existed_files.add(file_name)
+            to_write[serial] = (file_name, paragraph)
+            if records is not None:
+                records[file_name] = Word01Record(paragraph, grid)
+        table_serial = 0
+        for tag, elem in docx_body_elements(docx_file):
+            if tag == "tbl":
+                if table_serial in to_write:
+                    file_name, paragraph = to_write[table_serial]
+                    docx_write_table(path.join(path_to_store, file_name), paragraph, elem)
+                table_serial += 1
         # 寻找附件2的信息
 
     @staticmethod
-    def case02(path_to_store: str, word01_files_ls: List[str]) -> None:
+    def case02(path_to_store: str, word01_files_ls: List[str], records: Dict[str, Word01Record] = None) -> None:
         """
         所有被抽查户的附件一分别存在一个单独的文档中时的处理方案
         :param path_to_store: 目的文件存储路径
         :param word01_files_ls: 包含文件名（绝对路径）的列表
+        :param records: 不为None时，以移动后的文件名为键存入各户的 Word01Record
         """
         if not path.exists(path_to_store):
             os.mkdir(path_to_store)
@@ -759,13 +1933,17 @@ class VillageWord01Handle:
             elif word01.endswith('.wps'):
                 word01 = wps_to_docx(word01)
             docx = dx.Document(word01)
-            name = docx.tables[0].cell(0, 2).text
+            grid = TableGrid(docx.tables[0])
+            name = grid.text(0, 2)
             if not path.exists(path.join(path_to_store, f"{name}.docx")):
-                os.rename(word01, path.join(path_to_store, f"{name}.docx"))
+                file_name = f"{name}.docx"
                 name_dic[name] = 0
             else:
-                os.rename(word01, path.join(path_to_store, f"{name}-{name_dic[name] + 1:02d}.docx"))
+                file_name = f"{name}-{name_dic[name] + 1:02d}.docx"
                 name_dic[name] += 1
+            journal.rename(word01, path.join(path_to_store, file_name))
+            if records is not None:
+                records[file_name] = Word01Record(word01_info_text(docx), grid)
         return None
 
 
@@ -824,13 +2002,14 @@ class VillageWord02Handle:
         :param path_to_store: 目的文件存储路径
         :param word02_file: 文件名（绝对路径）
         """
-        os.rename(word02_file, path.join(path_to_store, "附件2-整体抗震性能统计表.docx"))
+        journal.rename(word02_file, path.join(path_to_store, "附件2-整体抗震性能统计表.docx"))
 
 
 class VillageExcel01Handle:
 
     @staticmethod
-    def case00(path_to_store, region_name: str, town_name: str, village_name: str, excel01_root_path: str) -> None:
+    def case00(path_to_store, region_name: str, town_name: str, village_name: str, excel01_root_path: str,
+               records: Dict[str, Word01Record] = None) -> None:
         """
         未找到 excel01 源文件时的处理方案
         :param path_to_store: 目的文件存储路径
@@ -838,44 +2017,25 @@ class VillageExcel01Handle:
         :param town_name: 该村所在镇名
         :param village_name: 该村村名
         :param excel01_root_path: 存储 word01 的上级根目录
+        :param records: 拆分附件1时得到的各户记录，与 excel01_root_path 中的文件一一对应时不再重新解析文档
         """
         files = os.listdir(excel01_root_path)
-        excel = xlsxwriter.Workbook(path.join(path_to_store, "单体抗震性能调查表.xlsx"), {'constant_memory': False})
-        sheet01 = excel.add_worksheet(name="sheet1")
-        format01 = excel.add_format({'align': 'left', 'valign': 'vdistributed', })
-        names = [
-            "编号", "北纬", "东经", "区", "乡镇", "村庄", "户主", "户主联系方式", "建筑年代", "层数", "结构类型", "建筑高度",
-            "建筑宽度", "建筑长度", "常住人口", "平面", "立面", "房屋间数", "场地条件", "基坑深度", "基坑回填材料", "基础材料",
-            "基础砌筑砂浆材料", "墙体砌块材料", "墙体砂浆材料", "外墙厚度", "内墙厚度", "烟道", "女儿墙", "上部圈梁", "上部圈梁闭合",
-            "基础圈梁", "基础圈梁闭合", "构造柱", "屋盖类别", "楼板类别", "墙体歪闪", "墙体腐蚀", "墙体裂缝", "基础沉降", "屋盖情况",
-            "填表人", "填表人联系方式"
-        ]
-        heads = [
-            'A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'Q', 'R', 'S', 'T', 'U', 'V', 'W', 'X', 'Y', 'Z',
-            'AA', 'AB', 'AC', 'AD', 'AE', 'AF', 'AG', 'AH', 'AI', 'AJ', 'AK', 'AL', 'AM', 'AN', 'AO', 'AP', 'AQ'
-        ]
-        for name, head in zip(names, heads):
-            sheet01.write_string(head + '1', name, format01)
+        if records is not None and set(records.keys()) != set(files):
+            records = None
         location = {"region_name": region_name, "town_name": town_name, "village_name": village_name}
-        for i, file in enumerate(files):
-            docx = dx.Document(path.join(excel01_root_path, file))
-            info_text = ""
-            for paragraph in docx.paragraphs:
-                text: str = paragraph.text
-                if text.find("户主") != -1 and text.find("联系方式") != -1:
-                    info_text = text
-            name_found = re.findall(r"[\u4E00-\u9FA5]{2,4}", info_text)
-            phone_found = re.findall(r"\d{8,11}", info_text)
-            name_found.remove("户主")
-            name_found.remove("联系方式")
-            if "时间" in name_found:
-                name_found.remove("时间")
-            elif "日期" in name_found:
-                name_found.remove("日期")
-            info_dic = get_excel01_dict(location, name_found[0] if name_found else "", phone_found[0] if phone_found else "", docx.tables[0])
-            for name, head in zip(names, heads):
-                sheet01.write_string(head + f'{i + 2}', info_dic[name], format01)
-        excel.close()
+
+        def rows():
+            for file in files:
+                if records is not None:
+                    info_text, table = records[file].info_text, records[file].grid
+                else:
+                    docx = dx.Document(path.join(excel01_root_path, file))
+                    info_text, table = word01_info_text(docx), docx.tables[0]
+                name_found, phone_found = word01_name_phone(info_text)
+                info_dic = get_excel01_dict(location, name_found, phone_found, table)
+                yield [info_dic[name] for name in EXCEL01_HEADS]
+
+        write_excel01(path.join(path_to_store, "单体抗震性能调查表.xlsx"), rows())
 
     @staticmethod
     def case01(path_to_store: str, excel01_file: str) -> None:
@@ -886,7 +2046,7 @@ class VillageExcel01Handle:
         """
         if excel01_file.endswith('.xls'):
             excel01_file = xls_to_xlsx(excel01_file)
-        os.rename(excel01_file, path.join(path_to_store, "单体抗震性能调查表.xlsx"))
+        journal.rename(excel01_file, path.join(path_to_store, "单体抗震性能调查表.xlsx"))
 
 
 class VillageExcel02Handle:
@@ -921,7 +2081,7 @@ class VillageExcel02Handle:
         """
         if excel02_file.endswith('.xls'):
             excel02_file = xls_to_xlsx(excel02_file)
-        os.rename(excel02_file, path.join(path_to_store, "整体抗震性能统计表.xlsx"))
+        journal.rename(excel02_file, path.join(path_to_store, "整体抗震性能统计表.xlsx"))
 
 
 class VillagePhotosHandle:
@@ -934,13 +2094,15 @@ class VillagePhotosHandle:
         pass
 
     @staticmethod
-    def case01(path_to_store: str, photo_files_ls: List[str]) -> None:
+    def case01(path_to_store: str, photo_files_ls: List[str], dedup: bool = False) -> Dict[str, str]:
         """
         找到照片时的处理方案
         :param path_to_store: 目的文件存储路径
         :param photo_files_ls: 包照片文件名（绝对路径）的列表
+        :param dedup: 是否去除重复照片：同一户（同一目的文件夹）中内容相同的照片只保留第一张，其余留在原位置
+        :return: 重复照片 -> 保留的照片（移动后的文件名）
         """
-        photo_names_ls = [file.split('\\')[-1] for file in photo_files_ls]
+        photo_names_ls = [path.basename(file) for file in photo_files_ls]
         photo_new_names_ls = []
         for photo_name in photo_names_ls:
             number_found = photo_find_number(photo_name)
@@ -951,26 +2113,42 @@ class VillagePhotosHandle:
                 photo_new_names_ls.append(name_found)
             else:
                 photo_new_names_ls.append(photo_name)
+        households = [
+            photo_name if (
+                    re.match(r'^[A-Za-z]{2,4}-[A-Za-z]{2,4}-[A-Za-z]{2,4}-[0-9]{2,3}$', photo_name)
+                    or re.match(r'^[\u4E00-\u9FA5]{2,4}$', photo_name)
+            ) else "未知"
+            for photo_name in photo_new_names_ls
+        ]
+        duplicates = {}
+        if dedup:
+            duplicates = find_duplicates(photo_files_ls, households)
         serial_number_dic = {}
+        unknown_names = set()  # 已占用的未知照片文件名
+        moves = []
         for i in range(len(photo_files_ls)):
             photo_name = photo_new_names_ls[i]
             photo_file = photo_files_ls[i]
-            if not (
-                    re.match(r'^[A-Za-z]{2,4}-[A-Za-z]{2,4}-[A-Za-z]{2,4}-[0-9]{2,3}$', photo_name)
-                    or re.match(r'^[\u4E00-\u9FA5]{2,4}$', photo_name)
-            ):
-                if not path.exists(path.join(path_to_store, "未知")):
-                    os.mkdir(path.join(path_to_store, "未知"))
-                os.rename(photo_file, path.join(path_to_store, "未知", photo_name))
+            if photo_file in duplicates:
+                continue
+            if households[i] == "未知":
+                # 多张未知照片同名时，在文件名前加上序号，全部保留
+                unknown_file, n = path.join(path_to_store, "未知", photo_name), 1
+                while unknown_file in unknown_names or path.exists(unknown_file):
+                    n += 1
+                    unknown_file = path.join(path_to_store, "未知", f"{n:02d}-{photo_name}")
+                unknown_names.add(unknown_file)
+                moves.append((photo_file, unknown_file))
             else:
                 if photo_name not in serial_number_dic.keys():
-                    if not path.exists(path.join(path_to_store, photo_name)):
-                        os.mkdir(path.join(path_to_store, photo_name))
                     serial_number_dic[photo_name] = 1
                 else:
                     serial_number_dic[photo_name] += 1
                 postfix = '.' + photo_file.split('.')[-1]
-                os.rename(photo_file, path.join(path_to_store, photo_name, f"{photo_name}-{serial_number_dic[photo_name]:02d}{postfix}"))
+                moves.append((photo_file, path.join(path_to_store, photo_name, f"{photo_name}-{serial_number_dic[photo_name]:02d}{postfix}")))
+        journal.rename_batch(moves)
+        moved = dict(moves)
+        return {file: moved[kept] for file, kept in duplicates.items()}
 
 
 class TownWord02Handle:
@@ -988,7 +2166,7 @@ class TownWord02Handle:
         :param town_name: 镇名
         :param word02_file: 文件名（绝对路径）
         """
-        os.rename(word02_file, path.join(path_to_store, f"{region_name}-{town_name}-整体抗震性能统计表.docx"))
+        move.move(word02_file, path.join(path_to_store, f"{region_name}-{town_name}-整体抗震性能统计表.docx"))
 
 
 class TownExcel01Handle:
@@ -1009,4 +2187,4 @@ class TownExcel01Handle:
         :param town_name: 镇名
         :param excel01_file: 文件名（绝对路径）
         """
-        os.rename(excel01_file, path.join(path_to_store, f"{region_name}-{town_name}-单体抗震性能调查表.xlsx"))
+        move.move(excel01_file, path.join(path_to_store, f"{region_name}-{town_name}-单体抗震性能调查表.xlsx"))
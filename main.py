@@ -2,28 +2,109 @@
     Author:Jack Xu
     Gmail:jack2919048985@gmail.com
 """
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pprint import pprint
+from typing import Dict, List, Tuple
 
-from data_handle.disposal import Town
-from data_handle.utils import clean_region_dir
+from data_handle.disposal import Town, Village, handle_village
+from data_handle.downscale import PhotoScaler
+from data_handle.utils import clean_region_dir, get_dir_weight, list_dir
 
 
-def main():
-    root_path = "G:\\python\\DataArrangement2.0\\data"
-    log_path = "G:\\python\\DataArrangement2.0\\log"
-    region_dirs = [d for d in os.listdir(root_path) if os.path.isdir(os.path.join(root_path, d))]
-    for region_dir in region_dirs:
-        clean_region_dir(os.path.join(root_path, region_dir))
-    region_names = [d for d in os.listdir(root_path) if os.path.isdir(os.path.join(root_path, d))]
+def scan_towns(root_path: str, log_path: str) -> List[Town]:
+    """
+    扫描数据根目录下的所有镇
+    :param root_path: 数据根目录
+    :param log_path: 日志存储路径
+    :return: 包含所有 Town 对象的列表
+    """
+    towns = []
+    region_names = [entry.name for entry in list_dir(root_path) if entry.is_dir]
     for region_name in region_names:
-        town_names = [d for d in os.listdir(os.path.join(root_path, region_name)) if os.path.isdir(os.path.join(root_path, region_name, d))]
+        town_names = [entry.name for entry in list_dir(os.path.join(root_path, region_name)) if entry.is_dir]
         for town_name in town_names:
-            town = Town(root_path, region_name, town_name, log_path)
-            town.villages_handle()
+            towns.append(Town(root_path, region_name, town_name, log_path))
+    return towns
+
+
+def schedule(towns: List[Town], workers: int, resume: bool = False, dedup_photos: bool = False, photo_scaler: PhotoScaler = None) -> None:
+    """
+    将所有镇的村按数据量从大到小分发给进程池处理，某镇的村全部处理完成后立即处理该镇
+    :param towns: 包含所有 Town 对象的列表
+    :param workers: 并行处理的进程数
+    :param resume: 是否从上次中断处继续，见 handle_village
+    :param dedup_photos: 是否去除同一户中内容相同的照片
+    :param photo_scaler: 照片缩小的设置，为None时不缩小照片
+    """
+    # 预先统计每个村的文件数量与总字节数
+    tasks: List[Tuple[Tuple[int, int], Town, str]] = []
+    for town in towns:
+        for village_name in town.village_names:
+            count, size = get_dir_weight(os.path.join(town.path, village_name))
+            tasks.append(((size, count), town, village_name))
+    tasks.sort(key=lambda task: task[0], reverse=True)
+    remaining: Dict[Town, int] = {town: len(town.village_names) for town in towns}
+    for town in towns:
+        if remaining[town] == 0:
+            town.word02_handle()
+            town.excel01_handle()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(handle_village, town.root_path, town.region_name, town.town_name, village_name, town.log_path, resume, dedup_photos, photo_scaler): (town, village_name)
+            for _, town, village_name in tasks
+        }
+        for future in as_completed(futures):
+            town, village_name = futures[future]
+            try:
+                town.villages.append(future.result())
+            except Exception:
+                print(f"can not handle {town}-{village_name}")
+            remaining[town] -= 1
+            if remaining[town] == 0:
+                town.word02_handle()
+                town.excel01_handle()
+
+
+def main(root_path: str = "G:\\python\\DataArrangement2.0\\data", log_path: str = "G:\\python\\DataArrangement2.0\\log", workers: int = 1,
+         dry_run: bool = False, resume: bool = False, dedup_photos: bool = False, photo_scaler: PhotoScaler = None):
+    region_dirs = [entry.name for entry in list_dir(root_path) if entry.is_dir]
+    for region_dir in region_dirs:
+        clean_region_dir(os.path.join(root_path, region_dir), dry_run)
+    if dry_run:
+        # 只读检查每个镇、每个村将得到的内容与将执行的操作
+        for town in scan_towns(root_path, log_path):
+            report = town.inspect()
+            pprint(report)
+            for village_name in report["substances"]["village_names"]:
+                pprint(Village(root_path, town.region_name, town.town_name, village_name, log_path).inspect())
+        return
+    towns = scan_towns(root_path, log_path)
+    if workers <= 1:
+        for town in towns:
+            town.villages_handle(resume=resume, dedup_photos=dedup_photos, photo_scaler=photo_scaler)
             town.word02_handle()
             town.excel01_handle()
+    else:
+        schedule(towns, workers, resume, dedup_photos, photo_scaler)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default="G:\\python\\DataArrangement2.0\\data", help="数据根目录")
+    parser.add_argument("--log", default="G:\\python\\DataArrangement2.0\\log", help="日志存储路径")
+    parser.add_argument("--workers", type=int, default=1, help="并行处理的进程数")
+    parser.add_argument("--dry-run", action="store_true", help="只打印目录整理计划与各镇、村的检查结果，不做任何修改")
+    parser.add_argument("--resume", action="store_true", help="从上次中断处继续：回滚处理到一半的村后重新处理")
+    parser.add_argument("--dedup-photos", action="store_true", help="去除同一户中内容相同的照片，并记录在日志中")
+    parser.add_argument("--downscale", action="store_true", help="照片整理完成后缩小照片（需要 Pillow）")
+    parser.add_argument("--max-edge", type=int, default=2048, help="缩小后照片最长边的像素数")
+    parser.add_argument("--quality", type=int, default=85, help="缩小后照片的 JPEG 质量（1-95）")
+    parser.add_argument("--replace-photos", action="store_true", help="缩小后直接替换原图，否则在\"照片-压缩\"文件夹中生成副本")
+    args = parser.parse_args()
+    scaler = None
+    if args.downscale:
+        # 各村并行处理时，每个村分到的进程数相应减少
+        scaler = PhotoScaler(args.max_edge, args.quality, args.replace_photos, max(1, (os.cpu_count() or 1) // max(1, args.workers)))
+    main(args.root, args.log, args.workers, args.dry_run, args.resume, args.dedup_photos, scaler)
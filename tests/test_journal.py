@@ -0,0 +1,97 @@
+"""
+    Author:Jack Xu
+    Gmail:jack2919048985@gmail.com
+"""
+import os
+import os.path as path
+import shutil
+import tempfile
+import unittest
+import io
+import zipfile
+from unittest import mock
+
+from data_handle import convert, disposal
+from data_handle.downscale import Image, PhotoScaler
+from data_handle.journal import VillageJournal
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 1024
+
+
+class Crash(BaseException):
+    """
+    模拟处理过程中进程被中断
+    """
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp()
+        self.root_path = path.join(self.tmp_path, "data")
+        self.log_path = path.join(self.tmp_path, "log")
+        self.village_path = path.join(self.root_path, "R", "T", "V")
+        os.makedirs(path.join(self.village_path, "上传"))
+        os.makedirs(self.log_path)
+        with zipfile.ZipFile(path.join(self.village_path, "上传", "照片.zip"), "w") as zip_file:
+            zip_file.writestr("照片/张三.jpg", JPEG)
+        self.pool = convert.get_pool()
+        convert.set_pool(convert.ConverterPool(convert.FakeBackend))
+
+    def tearDown(self):
+        convert.set_pool(self.pool)
+        shutil.rmtree(self.tmp_path)
+
+    def handle(self):
+        return disposal.handle_village(self.root_path, "R", "T", "V", self.log_path, resume=True)
+
+    def test_resume_zip_photo(self):
+        photos_handle = disposal.Village.photos_handle
+
+        def crash(village):
+            # 照片已从压缩包解压并放入照片文件夹后中断
+            photos_handle(village)
+            raise Crash()
+
+        with mock.patch.object(disposal.Village, "photos_handle", crash):
+            with self.assertRaises(Crash):
+                self.handle()
+        self.assertEqual(VillageJournal(self.log_path, "R", "T", "V").state(), "interrupted")
+        self.assertTrue(path.isfile(path.join(self.village_path, "照片", "张三", "张三-01.jpg")))
+
+        village = self.handle()
+        self.assertTrue(village.states["photos_handled"])
+        self.assertEqual(VillageJournal(self.log_path, "R", "T", "V").state(), "done")
+        self.assertEqual(os.listdir(path.join(self.village_path, "照片", "张三")), ["张三-01.jpg"])
+        # 回滚时删除了解压出的照片，重新处理时不会出现 "02-" 副本
+        self.assertEqual(os.listdir(path.join(self.village_path, "暂存")), ["照片.zip"])
+
+    def test_resume_done_new_upload(self):
+        self.handle()
+        self.assertEqual(VillageJournal(self.log_path, "R", "T", "V").state(), "done")
+        # 处理完成后又上传了新照片，继续运行时不能跳过该村
+        os.makedirs(path.join(self.village_path, "上传"))
+        with open(path.join(self.village_path, "上传", "李四.jpg"), "wb") as f:
+            f.write(JPEG)
+        self.handle()
+        self.assertEqual(os.listdir(path.join(self.village_path, "照片", "李四")), ["李四-01.jpg"])
+        self.assertEqual(os.listdir(path.join(self.village_path, "照片", "张三")), ["张三-01.jpg"])
+
+    @unittest.skipIf(Image is None, "Pillow is not available")
+    def test_rescan_downscale(self):
+        image = io.BytesIO()
+        Image.new("RGB", (64, 48)).save(image, "JPEG")
+        with open(path.join(self.village_path, "上传", "李四.jpg"), "wb") as f:
+            f.write(image.getvalue())
+        for _ in range(2):
+            village = disposal.handle_village(self.root_path, "R", "T", "V", self.log_path, photo_scaler=PhotoScaler(max_edge=16))
+            self.assertTrue(village.states["photos_handled"])
+        # 再次扫描时副本不会被当作上传的照片重新放入照片文件夹
+        self.assertEqual(os.listdir(path.join(self.village_path, "照片", "李四")), ["李四-01.jpg"])
+        self.assertEqual(os.listdir(path.join(self.village_path, "照片-压缩", "李四")), ["李四-01.jpg"])
+        with Image.open(path.join(self.village_path, "照片-压缩", "李四", "李四-01.jpg")) as scaled:
+            self.assertEqual(scaled.size, (16, 12))
+
+
+if __name__ == '__main__':
+    unittest.main()